@@ -0,0 +1,297 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+# 共有キャッシュの接続先 (未設定ならプロセス内キャッシュのみ)
+#   redis://localhost:6379/0  → Redis (redis パッケージが必要)
+#   sqlite:////tmp/cache.db   → SQLite (単一ホストで複数ワーカーが共有)
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "10000"))
+# 共有キャッシュがある場合、プロセス内キャッシュに保持する最大秒数
+# (他のワーカーでの削除・無効化が反映されるまでの最大遅延になる)
+CACHE_LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", "30"))
+# 共有キャッシュへの接続・応答を待つ最大秒数 (止まっていてもリクエストを待たせないため)
+CACHE_SHARED_TIMEOUT = float(os.getenv("CACHE_SHARED_TIMEOUT", "0.5"))
+# 共有キャッシュのエラーをログに出す間隔 (秒)
+CACHE_ERROR_LOG_INTERVAL = 60
+
+# キャッシュに値が無いことを表す (None もキャッシュできるようにするため)
+MISSING = object()
+
+
+class LocalCache:
+    """
+    プロセス内の LRU キャッシュ (TTL付き)
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return MISSING
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class _SharedCacheErrors:
+    """
+    共有キャッシュのエラーはキャッシュが無いものとして扱い、ログは間隔を空けて出す
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._last_logged = 0.0
+
+    def log(self, error: Exception):
+        now = time.monotonic()
+        if now - self._last_logged >= CACHE_ERROR_LOG_INTERVAL:
+            self._last_logged = now
+            print(f"{self.name} キャッシュを利用できません。キャッシュ無しで処理します: {error!r}")
+
+
+class RedisCache:
+    """
+    Redis プロトコルの共有キャッシュ
+
+    client には redis-py 互換のクライアント (fakeredis なども可) を渡す。
+    Redis のエラーは取得ならキャッシュ無し、保存・削除なら何もしなかったものとして扱う
+    """
+
+    def __init__(self, client):
+        self.client = client
+        try:
+            from redis.exceptions import RedisError
+
+            self._errors = (RedisError, OSError)
+        except ImportError:
+            self._errors = (OSError,)
+        self._error_log = _SharedCacheErrors("Redis")
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCache":
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("CACHE_URL に Redis を指定する場合は redis パッケージが必要です")
+        return cls(
+            redis.Redis.from_url(url, socket_timeout=CACHE_SHARED_TIMEOUT, socket_connect_timeout=CACHE_SHARED_TIMEOUT)
+        )
+
+    def get(self, key: str) -> Any:
+        try:
+            data = self.client.get(key)
+        except self._errors as e:
+            self._error_log.log(e)
+            return MISSING
+        if data is None:
+            return MISSING
+        return json.loads(data)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        # 1秒未満の TTL も切り捨てずにミリ秒で指定する
+        try:
+            self.client.set(key, json.dumps(value), px=max(1, int(ttl * 1000)) if ttl else None)
+        except self._errors as e:
+            self._error_log.log(e)
+
+    def delete(self, key: str):
+        try:
+            self.client.delete(key)
+        except self._errors as e:
+            self._error_log.log(e)
+
+
+class SQLiteCache:
+    """
+    SQLite ファイルを使った共有キャッシュ (単一ホスト向け)
+
+    SQLite のエラー (ロック待ちのタイムアウトなど) は RedisCache と同じくキャッシュ無しとして扱う
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=CACHE_SHARED_TIMEOUT)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._lock = threading.Lock()
+        self._error_log = _SharedCacheErrors("SQLite")
+        self.purge_expired()
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> Optional[tuple]:
+        # 1行目を返す (エラーの場合は None)
+        try:
+            with self._lock:
+                return self._conn.execute(sql, parameters).fetchone()
+        except sqlite3.Error as e:
+            self._error_log.log(e)
+            return None
+
+    def get(self, key: str) -> Any:
+        row = self._execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,))
+        if row is None:
+            return MISSING
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return MISSING
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        self._execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at),
+        )
+
+    def delete(self, key: str):
+        self._execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def purge_expired(self):
+        self._execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+
+class TieredCache:
+    """
+    プロセス内キャッシュ (1段目) と共有キャッシュ (2段目) を組み合わせたキャッシュ
+
+    値は共有キャッシュに保存できるよう JSON に変換できるものに限る
+    """
+
+    def __init__(self, local: LocalCache, shared=None, local_ttl: float = CACHE_LOCAL_TTL):
+        self.local = local
+        self.shared = shared
+        self.local_ttl = local_ttl
+
+    def _local_ttl(self, ttl: Optional[float]) -> Optional[float]:
+        if self.shared is None:
+            return ttl
+        return min(ttl, self.local_ttl) if ttl else self.local_ttl
+
+    def get(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is not MISSING or self.shared is None:
+            return value
+        value = self.shared.get(key)
+        if value is not MISSING:
+            self.local.set(key, value, self._local_ttl(None))
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+        self.local.set(key, value, self._local_ttl(ttl))
+
+    def delete(self, key: str):
+        if self.shared is not None:
+            self.shared.delete(key)
+        self.local.delete(key)
+
+    def namespace(self, name: str) -> "Namespace":
+        return Namespace(self, name)
+
+
+class Namespace:
+    """
+    名前空間付きのキャッシュ
+
+    キーには名前空間のバージョンが含まれ、invalidate() でバージョンを上げると
+    名前空間内のすべてのキーがまとめて無効になる
+    """
+
+    def __init__(self, cache: TieredCache, name: str):
+        self.cache = cache
+        self.name = name
+        self._version_key = f"{name}:__version__"
+
+    def _version(self) -> int:
+        version = self.cache.get(self._version_key)
+        if version is MISSING:
+            # バージョンが消えていても古いキーが復活しないよう現在時刻から作る
+            version = self._new_version()
+        return version
+
+    def _new_version(self) -> int:
+        version = time.time_ns() // 1000
+        self.cache.set(self._version_key, version)
+        return version
+
+    def _key(self, key: str) -> str:
+        return f"{self.name}:v{self._version()}:{key}"
+
+    def get(self, key: str) -> Any:
+        return self.cache.get(self._key(key))
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.cache.set(self._key(key), value, ttl)
+
+    def delete(self, key: str):
+        self.cache.delete(self._key(key))
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        キャッシュに無ければ loader の結果を保存して返す (read-through)
+        """
+        full_key = self._key(key)
+        value = self.cache.get(full_key)
+        if value is MISSING:
+            value = loader()
+            self.cache.set(full_key, value, ttl)
+        return value
+
+    def invalidate(self):
+        self._new_version()
+
+
+def create_shared_cache(url: Optional[str]):
+    """
+    CACHE_URL から共有キャッシュを作成する
+    """
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache.from_url(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteCache(url[len("sqlite:///"):])
+    raise ValueError(f"対応していない CACHE_URL です: {url}")
+
+
+_cache: Optional[TieredCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TieredCache:
+    """
+    アプリ全体で使うキャッシュを取得する (初回アクセス時に初期化)
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TieredCache(LocalCache(CACHE_LOCAL_MAX_ENTRIES), create_shared_cache(CACHE_URL))
+    return _cache
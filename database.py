@@ -1,8 +1,14 @@
+import itertools
 import os
+import threading
+import time
+from typing import Optional
 
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 # モデル用のBase
 Base = declarative_base()
@@ -10,26 +16,257 @@ Base = declarative_base()
 
 # 環境変数からデータベースURLを取得
 DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("データベースURLが設定されていません")
+# SQLログ出力 (デフォルト有効)
+SQL_ECHO = os.getenv("SQL_ECHO", "true").lower() in ("1", "true", "yes")
+# 遅延初期化モード (デフォルト有効)
+# 有効な場合、Engine は最初にDBを使うリクエストで作成する (サーバーレスのコールドスタート対策)
+LAZY_INIT = os.getenv("LAZY_INIT", "true").lower() in ("1", "true", "yes")
 
-# Engine の作成
-engine = create_engine(
-    DATABASE_URL,
-    echo=True,  # ログ出力を有効化
-)
+# リードレプリカのURL (カンマ区切り、未設定なら読み取りもプライマリを使う)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# レプリカのヘルスチェック間隔 (秒)
+REPLICA_HEALTH_CHECK_INTERVAL = float(os.getenv("REPLICA_HEALTH_CHECK_INTERVAL", "10"))
+# 書き込み後にこの秒数の間はプライマリから読む (レプリカの遅延対策)
+REPLICA_STALENESS_SECONDS = float(os.getenv("REPLICA_STALENESS_SECONDS", "5"))
+# レプリカへの接続を待つ最大秒数 (落ちているレプリカでリクエストを待たせないため)
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", "2"))
+# 最後に書き込んだ時刻をクライアントとやり取りするヘッダーとCookie
+LAST_WRITE_HEADER = "X-Last-Write-At"
+LAST_WRITE_COOKIE = "last_write_at"
 
-# Sessionの作成
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Sessionの作成 (Engine は get_engine() で後からバインドする)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
-# Scoped session (スレッドセーフ)
-ScopedSession = scoped_session(SessionLocal)
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Engine を取得する (初回呼び出し時に作成)
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if not DATABASE_URL:
+                    raise ValueError("データベースURLが設定されていません")
+                _engine = create_engine(
+                    DATABASE_URL,
+                    echo=SQL_ECHO,  # ログ出力
+                )
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+if not LAZY_INIT:
+    get_engine()
+
+
+def upsert_statement(db: Session, model):
+    """
+    DBの種類に合わせた INSERT ... ON CONFLICT 用のステートメントを返す
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(model)
 
 
 # データベースセッションを取得する関数
 def get_db():
+    get_engine()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def _replica_connect_args(url: str) -> dict:
+    backend = make_url(url).get_backend_name()
+    if backend == "postgresql":
+        return {"connect_timeout": REPLICA_CONNECT_TIMEOUT}
+    if backend == "sqlite":
+        return {"timeout": REPLICA_CONNECT_TIMEOUT}
+    return {}
+
+
+class ReplicaSession(Session):
+    """
+    リードレプリカのセッション
+
+    レプリカでの実行が OperationalError (接続できない・切断されたなど) で失敗したら、
+    レプリカを使えないものとして記録し、プライマリで実行し直す
+    """
+
+    def __init__(self, *args, on_replica_failure=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_replica_failure = on_replica_failure
+
+    def _with_fallback(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except OperationalError as e:
+            primary = get_engine()
+            if self.bind is primary:
+                raise
+            print(f"リードレプリカでの実行に失敗したためプライマリで実行します: {e}")
+            self.rollback()
+            if self._on_replica_failure is not None:
+                self._on_replica_failure()
+            self.bind = primary
+            return method(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._with_fallback(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self._with_fallback(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self._with_fallback(super().scalars, *args, **kwargs)
+
+
+class ReplicaPool:
+    """
+    リードレプリカの集合
+
+    ラウンドロビンで選び、ヘルスチェックに失敗しているレプリカとチェック中のレプリカは飛ばす
+    """
+
+    def __init__(self, urls: list):
+        self._engines = [create_engine(url, echo=SQL_ECHO, connect_args=_replica_connect_args(url)) for url in urls]
+        self._sessionmakers = [
+            sessionmaker(
+                class_=ReplicaSession,
+                autocommit=False,
+                autoflush=False,
+                bind=engine,
+                on_replica_failure=lambda index=index: self.mark_unhealthy(index),
+            )
+            for index, engine in enumerate(self._engines)
+        ]
+        self._healthy = [True] * len(urls)
+        self._checking = [False] * len(urls)
+        self._checked_at = [0.0] * len(urls)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _is_healthy(self, index: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._checking[index]:
+                # 他のスレッドがチェック中 (応答が無い可能性があるので結果が出るまで使わない)
+                return False
+            if now - self._checked_at[index] < REPLICA_HEALTH_CHECK_INTERVAL:
+                return self._healthy[index]
+            self._checking[index] = True
+
+        try:
+            with self._engines[index].connect() as connection:
+                connection.execute(text("SELECT 1"))
+            healthy = True
+        except Exception as e:
+            print(f"リードレプリカ {index} のヘルスチェックに失敗しました: {e}")
+            healthy = False
+        with self._lock:
+            self._healthy[index] = healthy
+            self._checked_at[index] = time.monotonic()
+            self._checking[index] = False
+        return healthy
+
+    def mark_unhealthy(self, index: int):
+        """
+        レプリカを使えないものとして記録する (次のヘルスチェックまで使わない)
+        """
+        with self._lock:
+            self._healthy[index] = False
+            self._checked_at[index] = time.monotonic()
+
+    def choose(self) -> Optional[sessionmaker]:
+        """
+        使えるレプリカの sessionmaker を返す。すべて使えなければ None
+        """
+        start = next(self._counter)
+        for offset in range(len(self._sessionmakers)):
+            index = (start + offset) % len(self._sessionmakers)
+            if self._is_healthy(index):
+                return self._sessionmakers[index]
+        return None
+
+
+_replica_pool: Optional[ReplicaPool] = None
+_replica_pool_lock = threading.Lock()
+
+
+def get_replica_pool() -> Optional[ReplicaPool]:
+    """
+    リードレプリカを取得する (未設定なら None、初回呼び出し時に作成)
+    """
+    global _replica_pool
+    if _replica_pool is None and DATABASE_REPLICA_URLS:
+        with _replica_pool_lock:
+            if _replica_pool is None:
+                _replica_pool = ReplicaPool(DATABASE_REPLICA_URLS)
+    return _replica_pool
+
+
+def wrote_recently(request: Request) -> bool:
+    """
+    クライアントが直近に書き込んでいれば True (自分の書き込みを読めるようにプライマリを使う)
+    """
+    value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    if not value:
+        return False
+    try:
+        return time.time() - float(value) < REPLICA_STALENESS_SECONDS
+    except ValueError:
+        return False
+
+
+# 読み取り専用のデータベースセッションを取得する関数 (レプリカがあればレプリカを使う)
+def get_read_db(request: Request):
+    session_factory = None
+    replica_pool = get_replica_pool()
+    if replica_pool is not None and not wrote_recently(request):
+        session_factory = replica_pool.choose()
+    if session_factory is None:
+        get_engine()
+        session_factory = SessionLocal
+
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class LastWriteMiddleware:
+    """
+    書き込みに成功したレスポンスに書き込み時刻をヘッダーとCookieで付ける
+    """
+
+    WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_last_write(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                value = f"{time.time():.3f}"
+                max_age = int(REPLICA_STALENESS_SECONDS) + 1
+                cookie = f"{LAST_WRITE_COOKIE}={value}; Max-Age={max_age}; Path=/; SameSite=Lax"
+                message["headers"] = list(message.get("headers", [])) + [
+                    (LAST_WRITE_HEADER.lower().encode(), value.encode()),
+                    (b"set-cookie", cookie.encode()),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_last_write)
@@ -0,0 +1,61 @@
+"""
+投稿一覧用の非正規化テーブル post_feed の更新
+
+どの関数もコミットはしないので、呼び出し元の posts / users / saunas の更新と同じトランザクションで反映される
+"""
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import PostFeed, Sauna
+
+
+def feed_row(
+    post_id: int,
+    user_id: str,
+    sauna_id: str,
+    content: Optional[str],
+    created_at: datetime,
+    user_name: Optional[str],
+    sauna_name: str,
+) -> dict:
+    return {
+        "post_id": post_id,
+        "user_id": user_id,
+        "sauna_id": sauna_id,
+        "content": content,
+        "created_at": created_at,
+        "user_name": user_name,
+        "sauna_name": sauna_name,
+    }
+
+
+def add_to_feed(db: Session, rows: list):
+    """
+    投稿を post_feed に追加する (rows は feed_row() のリスト)
+    """
+    if rows:
+        db.execute(insert(PostFeed), rows)
+
+
+def remove_from_feed(db: Session, post_ids: Iterable[int]):
+    db.execute(delete(PostFeed).where(PostFeed.post_id.in_(list(post_ids))))
+
+
+def rename_user_in_feed(db: Session, user_id: str, user_name: Optional[str]):
+    db.execute(update(PostFeed).where(PostFeed.user_id == user_id).values(user_name=user_name))
+
+
+def refresh_sauna_names_in_feed(db: Session, sauna_ids: Iterable[str]):
+    """
+    saunas の名前を post_feed に反映する (名前が変わった行だけ更新する)
+    """
+    sauna_name = select(Sauna.name).where(Sauna.id == PostFeed.sauna_id).scalar_subquery()
+    db.execute(
+        update(PostFeed)
+        .where(PostFeed.sauna_id.in_(list(sauna_ids)), PostFeed.sauna_name != sauna_name)
+        .values(sauna_name=sauna_name)
+    )
+
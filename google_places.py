@@ -0,0 +1,206 @@
+import os
+import threading
+from typing import Optional
+
+from fastapi import HTTPException
+
+from cache import MISSING, get_cache
+
+# 環境変数からAPIキーを取得
+GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
+
+# Google Places API の結果をキャッシュする秒数
+PLACE_DETAILS_CACHE_TTL = int(os.getenv("PLACE_DETAILS_CACHE_TTL", str(24 * 60 * 60)))
+PLACE_SEARCH_CACHE_TTL = int(os.getenv("PLACE_SEARCH_CACHE_TTL", str(60 * 60)))
+
+# テキスト検索の既定の中心座標と半径
+SEARCH_LOCATION = "35.6895,139.6917"  # デフォルトの中心座標（東京駅付近）
+SEARCH_RADIUS = 50000  # 半径50km
+
+# 結果が0件でもエラーではない status (これ以外は HTTP 200 でもエラー)
+PLACES_OK_STATUSES = ("OK", "ZERO_RESULTS")
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+class PlacesAPIError(HTTPException):
+    """
+    Google Places API が OK / ZERO_RESULTS 以外の status を返した
+    (OVER_QUERY_LIMIT や REQUEST_DENIED も HTTP ステータスは 200 で返ってくる)
+    """
+
+    def __init__(self, status: str, message: Optional[str] = None):
+        detail = f"Google Places API がエラーを返しました: {status}"
+        super().__init__(status_code=500, detail=f"{detail} ({message})" if message else detail)
+        self.status = status
+
+
+def get_http_session():
+    """
+    Google API 用の HTTP セッションを取得する。
+    requests の import と接続プールの作成は初回リクエストまで遅らせる
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+
+                _http_session = requests.Session()
+    return _http_session
+
+
+def fetch_place_details_from_google(place_id: str):
+    """
+    Google Places APIから指定されたplace_idの詳細情報 (result) を取得する。
+    結果はキャッシュし、見つからない場合は None を返す
+    """
+    details_cache = get_cache().namespace("place_details")
+    result = details_cache.get(place_id)
+    if result is not MISSING:
+        return result
+
+    url = "https://maps.googleapis.com/maps/api/place/details/json"
+    params = {
+        "place_id": place_id,
+        "key": GOOGLE_PLACES_API_KEY,
+    }
+    response = get_http_session().get(url, params=params)
+    if response.status_code != 200:
+        raise HTTPException(status_code=500, detail="Google Places API リクエストに失敗しました")
+    data = response.json()
+    # 存在しない place_id は見つからない扱いにする
+    if data.get("status") not in (*PLACES_OK_STATUSES, "NOT_FOUND", "INVALID_REQUEST"):
+        raise PlacesAPIError(data.get("status"), data.get("error_message"))
+    result = data.get("result")
+    if result:
+        details_cache.set(place_id, result, PLACE_DETAILS_CACHE_TTL)
+    return result
+
+
+def fetch_sauna_details_from_google(place_id: str):
+    """
+    Google Places APIを使用して指定されたplace_idの詳細情報を取得する
+    """
+    result = fetch_place_details_from_google(place_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="指定されたplace_idに対応するサウナ情報が見つかりません")
+
+    # 都道府県を取得 (address_components から "administrative_area_level_1" を検索)
+    address_components = result.get("address_components", [])
+    prefecture = None
+    for component in address_components:
+        if "administrative_area_level_1" in component.get("types", []):
+            prefecture = component.get("long_name")
+            break
+
+    # デフォルト値を設定
+    if not prefecture:
+        prefecture = "Unknown Prefecture"
+
+    return {
+        "id": place_id,
+        "name": result.get("name"),
+        "address": result.get("formatted_address"),
+        "prefecture": prefecture,
+        "latitude": result.get("geometry", {}).get("location", {}).get("lat"),
+        "longitude": result.get("geometry", {}).get("location", {}).get("lng"),
+    }
+
+
+def fetch_sauna_photo_from_google(place_id: str, n: int, maxwidth: int):
+    """
+    Google Places APIを使用して指定されたplace_idのn番目の写真を取得する
+    """
+    result = fetch_place_details_from_google(place_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="サウナが見つかりません。")
+    photos = result.get("photos", [])
+    if n >= len(photos):
+        raise HTTPException(status_code=404, detail="写真が見つかりません。")
+
+    url = "https://maps.googleapis.com/maps/api/place/photo"
+    params = {
+        "photo_reference": photos[n].get("photo_reference"),
+        "maxwidth": maxwidth,
+        "key": GOOGLE_PLACES_API_KEY,
+    }
+    response = get_http_session().get(url, params=params)
+    if response.status_code != 200:
+        raise HTTPException(status_code=500, detail="Google Places Photo API リクエストに失敗しました。")
+
+    return response.content, response.headers.get("Content-Type", "image/jpeg")
+
+
+def sauna_search_keyword(prefecture: Optional[str], keyword: Optional[str]) -> str:
+    """
+    サウナ検索で Google に送る検索文字列 (検索結果のキャッシュキーにもなる)
+    """
+    return f"{prefecture or ''} {keyword or ''} サウナ".strip()
+
+
+def text_search_places(
+    search_keyword: str, location: str = SEARCH_LOCATION, radius: int = SEARCH_RADIUS, page_token: Optional[str] = None
+):
+    """
+    Google Places APIのテキスト検索を1ページ分実行する。(結果, 次のページのトークン) を返す
+    """
+    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+    params = {
+        "key": GOOGLE_PLACES_API_KEY,
+        "query": search_keyword,
+        "radius": radius,
+        "location": location,
+    }
+    if page_token:
+        params["pagetoken"] = page_token
+
+    # Google Places APIのリクエスト送信
+    response = get_http_session().get(url, params=params)
+    print(f"Google API Request URL: {response.url}")  # 確認用ログ
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=500, detail="Google Places APIのリクエストに失敗しました。")
+
+    # レスポンスの処理
+    data = response.json()
+    if data.get("status") not in PLACES_OK_STATUSES:
+        raise PlacesAPIError(data.get("status"), data.get("error_message"))
+    google_results = data.get("results", [])
+    print(f"Google API Results: {google_results}")  # 確認用ログ
+    return google_results, data.get("next_page_token")
+
+
+def format_search_results(google_results: list) -> list:
+    """
+    テキスト検索の結果を API のレスポンス形式に加工する
+    """
+    return [
+        {
+            "id": result.get("place_id"),
+            "name": result.get("name"),
+            "address": result.get("formatted_address", result.get("vicinity", "住所不明")),
+            "rating": result.get("rating"),
+        }
+        for result in google_results
+    ]
+
+
+def cache_search_results(search_keyword: str, saunas: list):
+    get_cache().namespace("place_searches").set(search_keyword, saunas, PLACE_SEARCH_CACHE_TTL)
+
+
+def search_saunas_from_google(search_keyword: str, location: str = SEARCH_LOCATION, radius: int = SEARCH_RADIUS):
+    """
+    Google Places APIのテキスト検索でサウナを検索する。
+    同じ検索条件の結果はキャッシュから返す
+    """
+    saunas = get_cache().namespace("place_searches").get(search_keyword)
+    if saunas is not MISSING:
+        return saunas
+
+    google_results, _ = text_search_places(search_keyword, location, radius)
+    saunas = format_search_results(google_results)
+    cache_search_results(search_keyword, saunas)
+    return saunas
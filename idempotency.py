@@ -0,0 +1,271 @@
+"""
+書き込みAPIの Idempotency-Key 対応
+
+同じ Idempotency-Key で再送されたリクエストには、処理を繰り返さずに保存しておいたレスポンスを返す
+(idempotency_keys テーブルだけを読み、users / saunas / posts には触れない)
+同じキーのリクエストが処理中の場合は、完了を待ってから同じレスポンスを返す
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from database import SessionLocal, get_engine, upsert_statement
+from models import IdempotencyKey, get_jst_now
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Idempotency-Key を受け付けるAPI
+IDEMPOTENT_ROUTES = {
+    ("POST", "/posts"),
+    ("POST", "/posts/batch"),
+    ("POST", "/favorites"),
+    ("POST", "/favorites/batch"),
+}
+# レスポンスを保存しておく時間 (秒)
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 60 * 60)))
+# 同じキーのリクエストが処理中のときに完了を待つ時間 (秒)。超えたら 409 を返す
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "10"))
+# 処理中のまま残ったキー (ワーカーが落ちた場合など) を破棄するまでの時間 (秒)
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+# 期限切れのキーを削除する間隔 (秒)
+IDEMPOTENCY_CLEANUP_INTERVAL = int(os.getenv("IDEMPOTENCY_CLEANUP_INTERVAL", "300"))
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+CLAIMED = "claimed"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+MISMATCH = "mismatch"
+
+
+def claim_key(key: str, fingerprint: str) -> Tuple[str, Optional[tuple]]:
+    """
+    キーを処理中として登録する。登録できれば CLAIMED、既にあれば
+    COMPLETED と (ステータスコード, Content-Type, ボディ)、IN_PROGRESS、MISMATCH のいずれかを返す
+    """
+    get_engine()
+    db = SessionLocal()
+    try:
+        while True:
+            now = get_jst_now()
+            statement = (
+                upsert_statement(db, IdempotencyKey)
+                .values(
+                    key=key,
+                    fingerprint=fingerprint,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL),
+                )
+                .on_conflict_do_nothing(index_elements=["key"])
+            )
+            claimed = db.execute(statement).rowcount == 1
+            db.commit()
+            if claimed:
+                return CLAIMED, None
+
+            row = db.get(IdempotencyKey, key)
+            if row is None:
+                continue
+            abandoned = row.status_code is None and row.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT)
+            if row.expires_at < now or abandoned:
+                db.query(IdempotencyKey).filter(
+                    IdempotencyKey.key == key, IdempotencyKey.created_at == row.created_at
+                ).delete()
+                db.commit()
+                continue
+            if row.fingerprint != fingerprint:
+                return MISMATCH, None
+            if row.status_code is None:
+                return IN_PROGRESS, None
+            return COMPLETED, (row.status_code, row.content_type, row.body)
+    finally:
+        db.close()
+
+
+def save_response(key: str, status_code: int, content_type: Optional[str], body: bytes):
+    get_engine()
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyKey).filter(IdempotencyKey.key == key).update(
+            {"status_code": status_code, "content_type": content_type, "body": body}
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def release_key(key: str):
+    """
+    処理に失敗したキーを削除して、再送を受け付けられるようにする
+    """
+    get_engine()
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyKey).filter(IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def purge_expired_keys() -> int:
+    """
+    期限切れのキーを削除し、削除した件数を返す
+    """
+    get_engine()
+    db = SessionLocal()
+    try:
+        deleted = db.query(IdempotencyKey).filter(IdempotencyKey.expires_at < get_jst_now()).delete()
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+async def _send_response(send, status_code: int, body: bytes, headers: list):
+    headers = [(b"content-length", str(len(body)).encode()), *headers]
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_error(send, status_code: int, detail: str, headers: Optional[list] = None):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await _send_response(send, status_code, body, [(b"content-type", b"application/json"), *(headers or [])])
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    # ボディを最後まで受け取る前にクライアントが切断した場合は None
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+class IdempotencyMiddleware:
+    """
+    Idempotency-Key ヘッダー付きの書き込みリクエストを1回だけ処理する
+    """
+
+    def __init__(self, app, routes=IDEMPOTENT_ROUTES):
+        self.app = app
+        self.routes = routes
+        # このプロセスで処理中のキー (同じキーのリクエストは完了を待つ)
+        self._inflight = {}
+        self._last_cleanup = time.monotonic()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = dict(scope["headers"]).get(IDEMPOTENCY_HEADER.lower().encode())
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            await _send_error(send, 400, f"{IDEMPOTENCY_HEADER} は1〜{MAX_IDEMPOTENCY_KEY_LENGTH}文字で指定してください")
+            return
+
+        body = await _read_body(receive)
+        if body is None:
+            # 途中までのボディでは処理せず、キーも登録しない (再送されたら最初から処理する)
+            return
+        key = hashlib.sha256(b"\n".join([scope["method"].encode(), scope["path"].encode(), idempotency_key])).hexdigest()
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        # 同じプロセスで処理中なら、DBを見に行かずに完了を待つ
+        while (inflight := self._inflight.get(key)) is not None:
+            try:
+                await asyncio.wait_for(inflight.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                await self._send_conflict(send)
+                return
+
+        done = asyncio.Event()
+        self._inflight[key] = done
+        try:
+            # 他のワーカーで処理中なら、完了するまでしばらく待つ
+            while True:
+                state, stored = await asyncio.to_thread(claim_key, key, fingerprint)
+                if state != IN_PROGRESS:
+                    break
+                if time.monotonic() >= deadline:
+                    await self._send_conflict(send)
+                    return
+                await asyncio.sleep(0.2)
+
+            if state == MISMATCH:
+                await _send_error(send, 422, f"同じ {IDEMPOTENCY_HEADER} で異なる内容のリクエストが送信されました")
+                return
+            if state == COMPLETED:
+                status_code, content_type, stored_body = stored
+                headers = [(REPLAYED_HEADER.lower().encode(), b"true")]
+                if content_type:
+                    headers.append((b"content-type", content_type.encode()))
+                await _send_response(send, status_code, stored_body or b"", headers)
+                return
+
+            await self._process(scope, receive, send, body, key)
+        finally:
+            del self._inflight[key]
+            done.set()
+
+    async def _process(self, scope, receive, send, body: bytes, key: str):
+        body_sent = False
+        response = {"status": None, "content_type": None, "chunks": []}
+
+        async def receive_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # ボディは読み終えているので、以降は切断の通知だけが届く
+            return await receive()
+
+        async def send_and_capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["content_type"] = dict(message.get("headers", [])).get(b"content-type")
+            elif message["type"] == "http.response.body":
+                response["chunks"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, send_and_capture)
+        except BaseException:
+            await asyncio.to_thread(release_key, key)
+            raise
+
+        # エラーは保存せず、再送されたら改めて処理する
+        # (4xx はボディの不備などで処理されておらず、正しい内容で再送すれば成功しうるため)
+        if response["status"] is None or response["status"] >= 400:
+            await asyncio.to_thread(release_key, key)
+        else:
+            content_type = response["content_type"].decode() if response["content_type"] else None
+            await asyncio.to_thread(save_response, key, response["status"], content_type, b"".join(response["chunks"]))
+        await self._cleanup()
+
+    async def _send_conflict(self, send):
+        await _send_error(
+            send,
+            409,
+            f"同じ {IDEMPOTENCY_HEADER} のリクエストを処理中です",
+            [(b"retry-after", str(max(1, int(IDEMPOTENCY_WAIT))).encode())],
+        )
+
+    async def _cleanup(self):
+        # 期限切れのキーをときどき削除する
+        if time.monotonic() - self._last_cleanup < IDEMPOTENCY_CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = time.monotonic()
+        try:
+            await asyncio.to_thread(purge_expired_keys)
+        except Exception as e:
+            print(f"期限切れの Idempotency-Key を削除できませんでした: {e}")
@@ -1,17 +1,57 @@
+import asyncio
+import hmac
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import List, Optional
 
-import requests
-from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi import (
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session, joinedload
-
-from database import get_db
-from models import Favorite, Post, Sauna, User
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
+
+from database import (
+    DATABASE_REPLICA_URLS,
+    LAST_WRITE_HEADER,
+    LastWriteMiddleware,
+    get_db,
+    get_read_db,
+    upsert_statement,
+)
+from google_places import (
+    GOOGLE_PLACES_API_KEY,
+    fetch_place_details_from_google,
+    fetch_sauna_details_from_google,
+    fetch_sauna_photo_from_google,
+    sauna_search_keyword,
+    search_saunas_from_google,
+)
+from feed import add_to_feed, feed_row, remove_from_feed, rename_user_in_feed
+from idempotency import REPLAYED_HEADER, IdempotencyMiddleware, purge_expired_keys
+from models import Favorite, Post, PostFeed, Sauna, User
+from partitions import ensure_future_partitions
+from photo_cache import get_photo_cache, pick_size_variant
+from pubsub import get_post_broker, post_event, publish_posts
+from ratelimit import RATE_LIMIT_ENABLED, ConcurrencyLimitMiddleware, RateLimitMiddleware
+from tiles import TILE_MAX_ZOOM, get_tile, invalidate_tiles_after_commit, invalidate_tiles_for_point
+from warmup import get_status as get_warmup_status
+from warmup import run_warmup, start_warmup
 
 # 環境変数からAPIキーとデータベースURLを取得
-GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not GOOGLE_PLACES_API_KEY:
@@ -19,9 +59,29 @@ if not GOOGLE_PLACES_API_KEY:
 if not DATABASE_URL:
     raise ValueError("データベースURLが設定されていません")
 
+# 一括登録APIで受け付ける最大件数と、未登録サウナを Google から並列取得する数
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_GOOGLE_CONCURRENCY = int(os.getenv("BATCH_GOOGLE_CONCURRENCY", "8"))
+# 投稿ストリームで接続維持のためにコメントを送る間隔 (秒)
+POSTS_STREAM_HEARTBEAT = float(os.getenv("POSTS_STREAM_HEARTBEAT", "15"))
+# 管理用APIのトークン (Vercel Cron からは CRON_SECRET が Bearer トークンとして送られる)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+CRON_SECRET = os.getenv("CRON_SECRET")
+# 日次の cron で1回に実行するウォームアップの時間 (秒)。残りは翌日以降に続きから実行する
+WARMUP_TIME_BUDGET = float(os.getenv("WARMUP_TIME_BUDGET", "240"))
+# POST /admin/warmup をバックグラウンドのスレッドで実行するか (レスポンス後もプロセスが動き続けるサーバーのみ)
+WARMUP_IN_BACKGROUND = os.getenv("WARMUP_IN_BACKGROUND", "false").lower() in ("1", "true", "yes")
+
 # アプリケーション初期化
 app = FastAPI()
 
+# 同時実行数の制限とレート制限 (CORSより内側に置き、429/503 にもCORSヘッダーを付ける)
+app.add_middleware(ConcurrencyLimitMiddleware)
+# Idempotency-Key 付きの再送は保存済みのレスポンスを返す (処理中の再送は同時実行数の枠を使わずに待つ)
+app.add_middleware(IdempotencyMiddleware)
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 # CORSミドルウェア設定
 app.add_middleware(
     CORSMiddleware,
@@ -29,8 +89,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[LAST_WRITE_HEADER, REPLAYED_HEADER],
 )
 
+# リードレプリカを使う場合は書き込み時刻をクライアントに返す (自分の書き込みを読めるようにするため)
+if DATABASE_REPLICA_URLS:
+    app.add_middleware(LastWriteMiddleware)
+
 
 # Pydanticスキーマ定義
 class UserCreate(BaseModel):
@@ -72,7 +137,7 @@ async def root():
 
 # ユーザー一覧取得
 @app.get("/users", response_model=List[UserCreate], tags=["users"])
-def get_users(db: Session = Depends(get_db)):
+def get_users(db: Session = Depends(get_read_db)):
     return db.query(User).all()
 
 
@@ -84,6 +149,9 @@ def create_or_update_user(user: UserCreate, db: Session = Depends(get_db)):
     if existing_user:
         # ユーザー情報を更新
         existing_user.email = user.email
+        if existing_user.name != user.name:
+            # 投稿一覧のユーザー名も同じトランザクションで更新
+            rename_user_in_feed(db, user.id, user.name)
         existing_user.name = user.name
         db.commit()
         db.refresh(existing_user)
@@ -97,44 +165,6 @@ def create_or_update_user(user: UserCreate, db: Session = Depends(get_db)):
     return new_user
 
 
-def fetch_sauna_details_from_google(place_id: str):
-    """
-    Google Places APIを使用して指定されたplace_idの詳細情報を取得する
-    """
-    url = "https://maps.googleapis.com/maps/api/place/details/json"
-    params = {
-        "place_id": place_id,
-        "key": GOOGLE_PLACES_API_KEY,
-    }
-    response = requests.get(url, params=params)
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Google Places API リクエストに失敗しました")
-    result = response.json().get("result")
-    if not result:
-        raise HTTPException(status_code=404, detail="指定されたplace_idに対応するサウナ情報が見つかりません")
-
-    # 都道府県を取得 (address_components から "administrative_area_level_1" を検索)
-    address_components = result.get("address_components", [])
-    prefecture = None
-    for component in address_components:
-        if "administrative_area_level_1" in component.get("types", []):
-            prefecture = component.get("long_name")
-            break
-
-    # デフォルト値を設定
-    if not prefecture:
-        prefecture = "Unknown Prefecture"
-
-    return {
-        "id": place_id,
-        "name": result.get("name"),
-        "address": result.get("formatted_address"),
-        "prefecture": prefecture,
-        "latitude": result.get("geometry", {}).get("location", {}).get("lat"),
-        "longitude": result.get("geometry", {}).get("location", {}).get("lng"),
-    }
-
-
 def insert_sauna_to_db(sauna_data: dict, db: Session):
     """
     サウナ情報をデータベースに挿入する
@@ -153,6 +183,7 @@ def insert_sauna_to_db(sauna_data: dict, db: Session):
     db.add(new_sauna)
     db.commit()
     db.refresh(new_sauna)
+    invalidate_tiles_for_point(new_sauna.latitude, new_sauna.longitude)
     return new_sauna
 
 
@@ -174,41 +205,184 @@ def create_post_with_sauna_registration(post: PostCreate, db: Session = Depends(
     # 投稿作成
     new_post = Post(user_id=post.user_id, sauna_id=sauna.id, content=post.content)
     db.add(new_post)
+    db.flush()
+    add_to_feed(
+        db,
+        [feed_row(new_post.id, user.id, sauna.id, new_post.content, new_post.created_at, user.name, sauna.name)],
+    )
     db.commit()
     db.refresh(new_post)
+
+    # ストリームの購読者に新しい投稿を配信
+    publish_posts([post_event(new_post, user.name, sauna.name)])
     return {"message": "Post created successfully", "post": new_post}
 
 
+def resolve_batch_items(items: list, db: Session):
+    """
+    一括登録の各要素のユーザーとサウナをまとめて確認する。
+    未登録のサウナは Google Places API から重複なく並列に取得して登録する (コミットはしない)。
+    戻り値はエラーになった要素の {index: (status_code, detail)} と、
+    ユーザー名・サウナ名の辞書 {id: name}
+    """
+    errors = {}
+
+    # ユーザーを1回のクエリで確認
+    user_ids = {item.user_id for item in items}
+    user_names = dict(db.query(User.id, User.name).filter(User.id.in_(user_ids)).all())
+    for index, item in enumerate(items):
+        if item.user_id not in user_names:
+            errors[index] = (404, "User not found")
+
+    # サウナを1回のクエリで確認
+    sauna_ids = {item.sauna_id for index, item in enumerate(items) if index not in errors}
+    sauna_names = dict(db.query(Sauna.id, Sauna.name).filter(Sauna.id.in_(sauna_ids)).all())
+
+    # 未登録のサウナは Google Places API から並列に取得
+    missing_sauna_ids = sorted(sauna_ids - sauna_names.keys())
+    sauna_errors = {}
+    sauna_rows = []
+
+    def fetch(sauna_id):
+        try:
+            return sauna_id, fetch_sauna_details_from_google(sauna_id)
+        except HTTPException as e:
+            return sauna_id, e
+
+    if missing_sauna_ids:
+        with ThreadPoolExecutor(max_workers=BATCH_GOOGLE_CONCURRENCY) as executor:
+            for sauna_id, result in executor.map(fetch, missing_sauna_ids):
+                if isinstance(result, HTTPException):
+                    sauna_errors[sauna_id] = (result.status_code, result.detail)
+                else:
+                    sauna_rows.append(result)
+                    sauna_names[sauna_id] = result["name"]
+
+    if sauna_rows:
+        # 同時に他のリクエストが登録していても失敗しないようにする
+        db.execute(upsert_statement(db, Sauna).on_conflict_do_nothing(index_elements=["id"]), sauna_rows)
+        invalidate_tiles_after_commit(db, [(row["latitude"], row["longitude"]) for row in sauna_rows])
+
+    for index, item in enumerate(items):
+        if index not in errors and item.sauna_id in sauna_errors:
+            errors[index] = sauna_errors[item.sauna_id]
+    return errors, user_names, sauna_names
+
+
+# サ活投稿の一括作成
+@app.post("/posts/batch", tags=["posts"])
+def create_posts_batch(posts: List[PostCreate], db: Session = Depends(get_db)):
+    """
+    複数のサ活投稿を1つのトランザクションでまとめて作成する。
+    結果はリクエストと同じ順番で要素ごとに返す
+    """
+    if len(posts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"一度に登録できるのは{BATCH_MAX_ITEMS}件までです")
+
+    errors, user_names, sauna_names = resolve_batch_items(posts, db)
+    valid = [(index, post) for index, post in enumerate(posts) if index not in errors]
+
+    created = {}
+    if valid:
+        rows = db.execute(
+            insert(Post).returning(Post.id, Post.created_at, sort_by_parameter_order=True),
+            [{"user_id": post.user_id, "sauna_id": post.sauna_id, "content": post.content} for _, post in valid],
+        ).all()
+        created = dict(zip((index for index, _ in valid), rows))
+        add_to_feed(
+            db,
+            [
+                feed_row(
+                    row.id,
+                    post.user_id,
+                    post.sauna_id,
+                    post.content,
+                    row.created_at,
+                    user_names[post.user_id],
+                    sauna_names[post.sauna_id],
+                )
+                for row, (_, post) in zip(rows, valid)
+            ],
+        )
+    db.commit()
+
+    results = []
+    events = []
+    for index, post in enumerate(posts):
+        if index in errors:
+            status_code, detail = errors[index]
+            results.append({"index": index, "status": "error", "status_code": status_code, "detail": detail})
+        else:
+            row = created[index]
+            new_post = Post(
+                id=row.id, user_id=post.user_id, sauna_id=post.sauna_id, content=post.content, created_at=row.created_at
+            )
+            events.append(post_event(new_post, user_names[post.user_id], sauna_names[post.sauna_id]))
+            results.append(
+                {
+                    "index": index,
+                    "status": "created",
+                    "post": {
+                        "id": row.id,
+                        "user_id": post.user_id,
+                        "sauna_id": post.sauna_id,
+                        "content": post.content,
+                        "created_at": row.created_at,
+                    },
+                }
+            )
+    # ストリームの購読者にまとめて配信
+    publish_posts(events)
+    return {"results": results}
+
+
 # サ活投稿取得
 @app.get("/posts", tags=["posts"])
 def get_posts(
-    sauna_id: Optional[str] = Query(None), user_id: Optional[str] = Query(None), db: Session = Depends(get_db)
+    sauna_id: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(Post).options(joinedload(Post.user), joinedload(Post.sauna))
+    # users / saunas と結合せずに post_feed のインデックスだけで一覧を返す
+    query = select(
+        PostFeed.post_id,
+        PostFeed.content,
+        PostFeed.created_at,
+        PostFeed.user_id,
+        PostFeed.user_name,
+        PostFeed.sauna_id,
+        PostFeed.sauna_name,
+    )
 
     if sauna_id:
-        query = query.filter(Post.sauna_id == sauna_id)
+        query = query.where(PostFeed.sauna_id == sauna_id)
     if user_id:
-        query = query.filter(Post.user_id == user_id)
+        query = query.where(PostFeed.user_id == user_id)
+    if since:
+        query = query.where(PostFeed.created_at >= since)
+    if until:
+        query = query.where(PostFeed.created_at < until)
 
-    posts = query.all()
+    rows = db.execute(query.order_by(PostFeed.created_at, PostFeed.post_id)).all()
 
-    # 必要なデータのみを返すように変換
+    # ORM オブジェクトを作らずにタプルから変換
     return [
         {
-            "id": post.id,
-            "content": post.content,
-            "created_at": post.created_at,
+            "id": post_id,
+            "content": content,
+            "created_at": created_at,
             "user": {
-                "id": post.user.id,
-                "name": post.user.name,
+                "id": post_user_id,
+                "name": user_name,
             },
             "sauna": {
-                "id": post.sauna.id,
-                "name": post.sauna.name,
+                "id": post_sauna_id,
+                "name": sauna_name,
             },
         }
-        for post in posts
+        for post_id, content, created_at, post_user_id, user_name, post_sauna_id, sauna_name in rows
     ]
 
 
@@ -219,6 +393,7 @@ def delete_post(post_id: int, db: Session = Depends(get_db)):
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     db.delete(post)
+    remove_from_feed(db, [post_id])
     db.commit()
     return {"message": f"Post {post_id} deleted successfully"}
 
@@ -235,60 +410,38 @@ def search_saunas(
     if not (prefecture or keyword):
         raise HTTPException(status_code=400, detail="検索条件が指定されていません。")
 
-    # Google Places API リクエストの準備
-    location = "35.6895,139.6917"  # デフォルトの中心座標（東京駅付近）
-    radius = 50000  # 半径50km
-    search_keyword = f"{prefecture or ''} {keyword or ''} サウナ".strip()
-
-    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-    params = {
-        "key": GOOGLE_PLACES_API_KEY,
-        "query": search_keyword,
-        "radius": radius,
-        "location": location,
-    }
-
-    # Google Places APIのリクエスト送信
-    response = requests.get(url, params=params)
-    print(f"Google API Request URL: {response.url}")  # 確認用ログ
+    saunas = search_saunas_from_google(sauna_search_keyword(prefecture, keyword))
 
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Google Places APIのリクエストに失敗しました。")
+    if not saunas:
+        return {"message": "該当するサウナが見つかりませんでした。"}
 
-    # レスポンスの処理
-    google_results = response.json().get("results", [])
-    print(f"Google API Results: {google_results}")  # 確認用ログ
+    return saunas
 
-    if not google_results:
-        return {"message": "該当するサウナが見つかりませんでした。"}
 
-    # 結果を加工して返す
-    saunas = [
-        {
-            "id": result.get("place_id"),
-            "name": result.get("name"),
-            "address": result.get("formatted_address", result.get("vicinity", "住所不明")),
-            "rating": result.get("rating"),
-        }
-        for result in google_results
-    ]
+# 地図表示用のサウナタイル
+@app.get("/saunas/tiles/{z}/{x}/{y}", tags=["saunas"])
+def get_sauna_tile(
+    request: Request,
+    z: int = Path(..., ge=0, le=TILE_MAX_ZOOM),
+    x: int = Path(..., ge=0),
+    y: int = Path(..., ge=0),
+    # キャッシュに無いタイルはプライマリから作る (tiles.get_tile を参照)
+    db: Session = Depends(get_db),
+):
+    if x >= 2**z or y >= 2**z:
+        raise HTTPException(status_code=404, detail="タイルが見つかりません。")
 
-    return saunas
+    body, etag = get_tile(db, z, x, y)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "public, max-age=60"}
+    if request.headers.get("If-None-Match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 # サウナ詳細
 @app.get("/saunas/{place_id}")
 def get_sauna_details(place_id: str):
-    url = "https://maps.googleapis.com/maps/api/place/details/json"
-    params = {
-        "place_id": place_id,
-        "key": GOOGLE_PLACES_API_KEY,
-    }
-    response = requests.get(url, params=params)
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Google Places API リクエストに失敗しました。")
-
-    result = response.json().get("result")
+    result = fetch_place_details_from_google(place_id)
     if not result:
         raise HTTPException(status_code=404, detail="サウナが見つかりません。")
 
@@ -307,6 +460,90 @@ def get_sauna_details(place_id: str):
     }
 
 
+# サウナ写真 (サーバー側でキャッシュして配信)
+@app.get("/saunas/{place_id}/photos/{n}", tags=["saunas"])
+def get_sauna_photo(place_id: str, n: int = Path(..., ge=0), maxwidth: int = Query(800, ge=1)):
+    # サイズは事前定義のバリエーションに揃えてキャッシュを共有する
+    size = pick_size_variant(maxwidth)
+    # 配信用のハードリンクから返すので、配信中に他のリクエストの保存で写真が削除されても失敗しない
+    photo_cache = get_photo_cache()
+    path, media_type = photo_cache.link_or_fetch(
+        f"{place_id}:{n}:{size}",
+        lambda: fetch_sauna_photo_from_google(place_id, n, size),
+    )
+    return FileResponse(
+        path,
+        media_type=media_type,
+        headers={"Cache-Control": "public, max-age=86400"},
+        background=BackgroundTask(photo_cache.unlink_served, path),
+    )
+
+
+# サウナの新着投稿ストリーム (Server-Sent Events)
+@app.get("/saunas/{place_id}/posts/stream", tags=["posts"])
+async def stream_sauna_posts(place_id: str):
+    broker = get_post_broker()
+
+    async def events():
+        subscriber = broker.subscribe(place_id)
+        try:
+            # 購読を開始したことをクライアントに知らせる (ヘッダーもすぐに送られる)
+            yield ": connected\n\n"
+            while True:
+                try:
+                    data = await asyncio.wait_for(subscriber.get(), timeout=POSTS_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # 接続を維持するためのコメント
+                    yield ": keep-alive\n\n"
+                    continue
+                if data is None:
+                    # 読み出しが遅れたので切断する (クライアントは GET /posts で取り直してから再接続する)
+                    yield "event: lagged\ndata: {}\n\n"
+                    break
+                yield f"event: post\ndata: {data}\n\n"
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# サウナの新着投稿ストリーム (WebSocket)
+@app.websocket("/saunas/{place_id}/posts/ws")
+async def websocket_sauna_posts(websocket: WebSocket, place_id: str):
+    await websocket.accept()
+    broker = get_post_broker()
+    subscriber = broker.subscribe(place_id)
+    # クライアントからの切断を検知するために受信を待つ
+    receiver = asyncio.create_task(websocket.receive())
+    try:
+        while True:
+            getter = asyncio.create_task(subscriber.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    getter.cancel()
+                    break
+                receiver = asyncio.create_task(websocket.receive())
+            if getter not in done:
+                getter.cancel()
+                continue
+            data = getter.result()
+            if data is None:
+                # 読み出しが遅れたので切断する
+                await websocket.close(code=1013)
+                break
+            await websocket.send_text(data)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        broker.unsubscribe(subscriber)
+
+
 # サウナ保存
 @app.post("/saunas", tags=["saunas"])
 def save_sauna(
@@ -338,6 +575,7 @@ def save_sauna(
     db.add(new_sauna)
     db.commit()
     db.refresh(new_sauna)
+    invalidate_tiles_for_point(new_sauna.latitude, new_sauna.longitude)
     return {"message": "Sauna saved successfully", "sauna": new_sauna}
 
 
@@ -370,8 +608,64 @@ def create_favorite_with_sauna_registration(favorite_request: FavoriteRequest, d
     return {"message": "Favorite created successfully", "favorite": new_favorite}
 
 
+# お気に入りの一括追加
+@app.post("/favorites/batch", tags=["favorites"])
+def create_favorites_batch(favorite_requests: List[FavoriteRequest], db: Session = Depends(get_db)):
+    """
+    複数のお気に入りを1つのトランザクションでまとめて追加する。
+    結果はリクエストと同じ順番で要素ごとに返す
+    """
+    if len(favorite_requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"一度に登録できるのは{BATCH_MAX_ITEMS}件までです")
+
+    errors, _, _ = resolve_batch_items(favorite_requests, db)
+
+    # 登録済みのお気に入りを1回のクエリで確認 (同じリクエスト内の重複もエラーにする)
+    candidates = [(index, item) for index, item in enumerate(favorite_requests) if index not in errors]
+    seen = set(
+        db.query(Favorite.user_id, Favorite.sauna_id)
+        .filter(
+            Favorite.user_id.in_({item.user_id for _, item in candidates}),
+            Favorite.sauna_id.in_({item.sauna_id for _, item in candidates}),
+        )
+        .all()
+    )
+    valid = []
+    for index, item in candidates:
+        key = (item.user_id, item.sauna_id)
+        if key in seen:
+            errors[index] = (400, "This sauna is already in favorites")
+        else:
+            seen.add(key)
+            valid.append((index, item))
+
+    created = {}
+    if valid:
+        rows = db.execute(
+            insert(Favorite).returning(Favorite.id, sort_by_parameter_order=True),
+            [{"user_id": item.user_id, "sauna_id": item.sauna_id} for _, item in valid],
+        ).all()
+        created = dict(zip((index for index, _ in valid), rows))
+    db.commit()
+
+    results = []
+    for index, item in enumerate(favorite_requests):
+        if index in errors:
+            status_code, detail = errors[index]
+            results.append({"index": index, "status": "error", "status_code": status_code, "detail": detail})
+        else:
+            results.append(
+                {
+                    "index": index,
+                    "status": "created",
+                    "favorite": {"id": created[index].id, "user_id": item.user_id, "sauna_id": item.sauna_id},
+                }
+            )
+    return {"results": results}
+
+
 @app.get("/favorites", tags=["favorites"])
-def get_favorites(user_id: str = Query(...), db: Session = Depends(get_db)):
+def get_favorites(user_id: str = Query(...), db: Session = Depends(get_read_db)):
     """
     特定のユーザーのお気に入りを取得する
     """
@@ -392,3 +686,51 @@ def remove_favorite(favorite_id: int, user_id: str = Query(...), db: Session = D
     db.delete(favorite)
     db.commit()
     return {"message": f"Favorite {favorite_id} removed successfully"}
+
+
+def require_admin(authorization: Optional[str] = Header(None)):
+    """
+    管理用APIの認証。ADMIN_TOKEN か CRON_SECRET を Bearer トークンとして受け付ける
+    """
+    tokens = [token for token in (ADMIN_TOKEN, CRON_SECRET) if token]
+    if not tokens:
+        raise HTTPException(status_code=403, detail="管理用APIは無効です")
+    given = (authorization or "").removeprefix("Bearer ").encode()
+    if not any(hmac.compare_digest(given, token.encode()) for token in tokens):
+        raise HTTPException(status_code=403, detail="認証に失敗しました")
+
+
+@app.post("/admin/warmup", tags=["admin"], dependencies=[Depends(require_admin)])
+def start_sauna_warmup(restart: bool = Query(False)):
+    """
+    都道府県ごとのサウナ情報のウォームアップを WARMUP_TIME_BUDGET 秒まで実行する (続きは次回の実行で再開する)。
+    WARMUP_IN_BACKGROUND が有効ならバックグラウンドで最後まで実行する
+    """
+    if WARMUP_IN_BACKGROUND:
+        if not start_warmup(restart=restart):
+            raise HTTPException(status_code=409, detail="ウォームアップは既に実行中です")
+        return get_warmup_status()
+    try:
+        return run_warmup(restart=restart, time_budget=WARMUP_TIME_BUDGET)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/admin/warmup", tags=["admin"], dependencies=[Depends(require_admin)])
+def get_sauna_warmup_status():
+    return get_warmup_status()
+
+
+@app.get("/admin/cron/daily", tags=["admin"], dependencies=[Depends(require_admin)])
+def run_daily_cron():
+    """
+    日次の定期実行 (Vercel Cron)。先の月のパーティション作成、期限切れの Idempotency-Key の削除、
+    時間を区切ったウォームアップを行う
+    """
+    created = ensure_future_partitions()
+    purged = purge_expired_keys()
+    try:
+        warmup = run_warmup(time_budget=WARMUP_TIME_BUDGET)
+    except RuntimeError as e:
+        warmup = {"skipped": str(e)}
+    return {"created_partitions": created, "purged_idempotency_keys": purged, "warmup": warmup}
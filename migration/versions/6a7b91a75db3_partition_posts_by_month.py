@@ -0,0 +1,93 @@
+"""Partition posts by month
+
+Revision ID: 6a7b91a75db3
+Revises: 9978dd9aab3e
+Create Date: 2026-10-19 12:30:00.000000
+
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a7b91a75db3'
+down_revision: Union[str, None] = '9978dd9aab3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 今月から何か月先までパーティションを作っておくか
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    # 既存テーブルを退避し、シーケンスは新しいテーブルに引き継ぐ
+    op.execute("ALTER TABLE posts RENAME TO posts_legacy")
+    op.execute("ALTER TABLE posts_legacy ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE posts_id_seq OWNED BY NONE")
+
+    # created_at で月別に分割するテーブル (主キーにはパーティションキーを含める必要がある)
+    op.execute("""
+        CREATE TABLE posts (
+            id INTEGER NOT NULL DEFAULT nextval('posts_id_seq'),
+            user_id VARCHAR(255) NOT NULL REFERENCES users (id),
+            sauna_id VARCHAR(255) NOT NULL REFERENCES saunas (id),
+            content TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'Asia/Tokyo'),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE posts_id_seq OWNED BY posts.id")
+    op.execute("CREATE TABLE posts_default PARTITION OF posts DEFAULT")
+
+    # 既存データの最初の月から数か月先までのパーティションを作成
+    this_month = datetime.now().date().replace(day=1)
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM posts_legacy")).scalar()
+    month = oldest.date().replace(day=1) if oldest else this_month
+    while month <= _add_months(this_month, MONTHS_AHEAD):
+        start, end = month.isoformat(), _add_months(month, 1).isoformat()
+        op.execute(
+            f"CREATE TABLE posts_y{month.year:04d}m{month.month:02d} PARTITION OF posts "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+        month = _add_months(month, 1)
+
+    op.execute("""
+        INSERT INTO posts (id, user_id, sauna_id, content, created_at)
+        SELECT id, user_id, sauna_id, content, COALESCE(created_at, now() AT TIME ZONE 'Asia/Tokyo')
+        FROM posts_legacy
+    """)
+    op.execute("DROP TABLE posts_legacy")
+
+    # 一覧取得で使う絞り込み用のインデックス (各パーティションにも作成される)
+    op.create_index('ix_posts_sauna_id_created_at', 'posts', ['sauna_id', 'created_at'])
+    op.create_index('ix_posts_user_id_created_at', 'posts', ['user_id', 'created_at'])
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE posts RENAME TO posts_partitioned")
+    op.execute("ALTER TABLE posts_partitioned ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE posts_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE posts (
+            id INTEGER NOT NULL DEFAULT nextval('posts_id_seq'),
+            user_id VARCHAR(255) NOT NULL REFERENCES users (id),
+            sauna_id VARCHAR(255) NOT NULL REFERENCES saunas (id),
+            content TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE posts_id_seq OWNED BY posts.id")
+    op.execute("""
+        INSERT INTO posts (id, user_id, sauna_id, content, created_at)
+        SELECT id, user_id, sauna_id, content, created_at FROM posts_partitioned
+    """)
+    op.execute("DROP TABLE posts_partitioned CASCADE")
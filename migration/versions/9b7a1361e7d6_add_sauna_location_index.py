@@ -0,0 +1,27 @@
+"""Add sauna location index
+
+Revision ID: 9b7a1361e7d6
+Revises: 6a7b91a75db3
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b7a1361e7d6'
+down_revision: Union[str, None] = '6a7b91a75db3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 地図タイルの範囲検索用
+    op.create_index('ix_saunas_latitude_longitude', 'saunas', ['latitude', 'longitude'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_saunas_latitude_longitude', table_name='saunas')
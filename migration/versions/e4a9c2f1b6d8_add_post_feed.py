@@ -0,0 +1,52 @@
+"""Add post feed
+
+Revision ID: e4a9c2f1b6d8
+Revises: c3f58e2a1d47
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a9c2f1b6d8'
+down_revision: Union[str, None] = 'c3f58e2a1d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('post_feed',
+    sa.Column('post_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.String(length=255), nullable=False),
+    sa.Column('sauna_id', sa.String(length=255), nullable=False),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('user_name', sa.Text(), nullable=True),
+    sa.Column('sauna_name', sa.String(length=255), nullable=False),
+    sa.PrimaryKeyConstraint('post_id')
+    )
+
+    # 既存の投稿を post_feed に登録
+    op.execute("""
+        INSERT INTO post_feed (post_id, user_id, sauna_id, content, created_at, user_name, sauna_name)
+        SELECT posts.id, posts.user_id, posts.sauna_id, posts.content,
+               posts.created_at, users.name, saunas.name
+        FROM posts
+        JOIN users ON users.id = posts.user_id
+        JOIN saunas ON saunas.id = posts.sauna_id
+    """)
+
+    op.create_index('ix_post_feed_created_at', 'post_feed', ['created_at'])
+    op.create_index('ix_post_feed_sauna_id_created_at', 'post_feed', ['sauna_id', 'created_at'])
+    op.create_index('ix_post_feed_user_id_created_at', 'post_feed', ['user_id', 'created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_post_feed_user_id_created_at', table_name='post_feed')
+    op.drop_index('ix_post_feed_sauna_id_created_at', table_name='post_feed')
+    op.drop_index('ix_post_feed_created_at', table_name='post_feed')
+    op.drop_table('post_feed')
@@ -0,0 +1,31 @@
+"""Add warmup progress
+
+Revision ID: f7d3b5a8c2e1
+Revises: e4a9c2f1b6d8
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7d3b5a8c2e1'
+down_revision: Union[str, None] = 'e4a9c2f1b6d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('warmup_progress',
+    sa.Column('prefecture', sa.String(length=255), nullable=False),
+    sa.Column('upserted', sa.Integer(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('prefecture')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('warmup_progress')
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String, Text
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, String, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -42,6 +42,9 @@ class Sauna(Base):
     posts = relationship("Post", back_populates="sauna", cascade="all, delete-orphan")
     favorites = relationship("Favorite", back_populates="sauna", cascade="all, delete-orphan")
 
+    # 地図タイルの範囲検索用
+    __table_args__ = (Index("ix_saunas_latitude_longitude", "latitude", "longitude"),)
+
     def __repr__(self):
         return f"<Sauna(id={self.id}, name={self.name}, address={self.address}, prefecture={self.prefecture})>"
 
@@ -53,16 +56,48 @@ class Post(Base):
     user_id = Column(String(255), ForeignKey("users.id"), nullable=False)
     sauna_id = Column(String(255), ForeignKey("saunas.id"), nullable=False)
     content = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=get_jst_now)
+    # DB上は created_at の月ごとにパーティション分割しており、主キーは (id, created_at) (partitions.py)
+    created_at = Column(DateTime, default=get_jst_now, nullable=False)
 
     # Relationship
     user = relationship("User", back_populates="posts")
     sauna = relationship("Sauna", back_populates="posts")
 
+    __table_args__ = (
+        Index("ix_posts_sauna_id_created_at", "sauna_id", "created_at"),
+        Index("ix_posts_user_id_created_at", "user_id", "created_at"),
+    )
+
     def __repr__(self):
         return f"<Post(id={self.id}, user_id={self.user_id}, sauna_id={self.sauna_id}, content={self.content}, created_at={self.created_at})>"
 
 
+class PostFeed(Base):
+    """
+    投稿一覧用の非正規化したテーブル (users / saunas と結合せずに一覧を返すため)
+    posts への登録・削除やユーザー名・サウナ名の変更と同じトランザクションで更新する (feed.py)
+    """
+
+    __tablename__ = "post_feed"
+
+    post_id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(String(255), nullable=False)
+    sauna_id = Column(String(255), nullable=False)
+    content = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    user_name = Column(Text, nullable=True)
+    sauna_name = Column(String(255), nullable=False)
+
+    __table_args__ = (
+        Index("ix_post_feed_created_at", "created_at"),
+        Index("ix_post_feed_sauna_id_created_at", "sauna_id", "created_at"),
+        Index("ix_post_feed_user_id_created_at", "user_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<PostFeed(post_id={self.post_id}, user_name={self.user_name}, sauna_name={self.sauna_name})>"
+
+
 class Favorite(Base):
     __tablename__ = "favorites"
 
@@ -76,3 +111,36 @@ class Favorite(Base):
 
     def __repr__(self):
         return f"<Favorite(id={self.id}, user_id={self.user_id}, sauna_id={self.sauna_id})>"
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    # メソッド・パス・Idempotency-Key ヘッダーの sha256
+    key = Column(String(64), primary_key=True)
+    # リクエストボディの sha256 (同じキーで内容の違うリクエストを弾くため)
+    fingerprint = Column(String(64), nullable=False)
+    # 処理中は NULL
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String(255), nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=get_jst_now, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey(key={self.key}, status_code={self.status_code}, expires_at={self.expires_at})>"
+
+
+class WarmupProgress(Base):
+    """
+    ウォームアップを完了した都道府県 (warmup.py のチェックポイント)
+    """
+
+    __tablename__ = "warmup_progress"
+
+    prefecture = Column(String(255), primary_key=True)
+    upserted = Column(Integer, nullable=False)
+    completed_at = Column(DateTime, default=get_jst_now, nullable=False)
+
+    def __repr__(self):
+        return f"<WarmupProgress(prefecture={self.prefecture}, completed_at={self.completed_at})>"
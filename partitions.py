@@ -0,0 +1,193 @@
+"""
+posts テーブルの月別パーティション管理 (PostgreSQL のみ)
+
+    python partitions.py maintain   今月から先の月のパーティションを作成する
+    python partitions.py archive    古いパーティションを圧縮ファイルに退避して削除する
+"""
+import gzip
+import os
+import re
+import sys
+import time
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from database import get_engine
+
+# 何か月先までパーティションを作っておくか
+POSTS_PARTITION_MONTHS_AHEAD = int(os.getenv("POSTS_PARTITION_MONTHS_AHEAD", "3"))
+# 何か月より古いパーティションをアーカイブするか
+POSTS_ARCHIVE_AFTER_MONTHS = int(os.getenv("POSTS_ARCHIVE_AFTER_MONTHS", "24"))
+# アーカイブ (gzip圧縮したCSV) の保存先
+POSTS_ARCHIVE_DIR = os.getenv("POSTS_ARCHIVE_DIR", "archive")
+# パーティションを切り離す際にロックを待つ最大時間と試行回数
+# (待ち続けると後ろに並んだ posts への読み書きがすべて止まるため、短く切り上げて再試行する)
+POSTS_DETACH_LOCK_TIMEOUT = os.getenv("POSTS_DETACH_LOCK_TIMEOUT", "3s")
+POSTS_DETACH_ATTEMPTS = int(os.getenv("POSTS_DETACH_ATTEMPTS", "5"))
+
+PARTITION_NAME_PATTERN = re.compile(r"^posts_y(\d{4})m(\d{2})$")
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"posts_y{month.year:04d}m{month.month:02d}"
+
+
+def list_partitions(connection) -> list:
+    """
+    posts の月別パーティションを (月初の日付, テーブル名) のリストで返す
+    """
+    rows = connection.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'posts'"
+        )
+    )
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_NAME_PATTERN.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+def list_detached_partitions(connection) -> list:
+    """
+    切り離し済みでまだ削除していない月別テーブル (アーカイブが途中で止まったもの) を
+    (月初の日付, テーブル名) のリストで返す
+    """
+    rows = connection.execute(
+        text("SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition AND relname LIKE 'posts_y%'")
+    )
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_NAME_PATTERN.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+def detach_partition(engine, name: str):
+    """
+    パーティションを posts から切り離す。
+
+    DETACH は posts に ACCESS EXCLUSIVE ロックを取るので、それだけを短いトランザクションで行い、
+    ロックを待つのは POSTS_DETACH_LOCK_TIMEOUT までにする
+    (DEFAULT パーティションがあるため DETACH PARTITION ... CONCURRENTLY は使えない)
+    """
+    for attempt in range(1, POSTS_DETACH_ATTEMPTS + 1):
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(f"SET LOCAL lock_timeout = '{POSTS_DETACH_LOCK_TIMEOUT}'"))
+                connection.execute(text(f"ALTER TABLE posts DETACH PARTITION {name}"))
+            return
+        except OperationalError as e:
+            if attempt == POSTS_DETACH_ATTEMPTS:
+                raise
+            print(f"{name} の切り離しでロックを取得できませんでした。再試行します ({attempt}/{POSTS_DETACH_ATTEMPTS}): {e}")
+            time.sleep(attempt)
+
+
+def create_partition(connection, month: date):
+    """
+    指定した月のパーティションを作成する。
+    デフォルトパーティションに入っている該当月の行は新しいパーティションに移す
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    connection.execute(text(f"CREATE TABLE {name} (LIKE posts INCLUDING DEFAULTS)"))
+    connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM posts_default WHERE created_at >= :start AND created_at < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": start, "end": end},
+    )
+    connection.execute(text(f"ALTER TABLE posts ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+
+
+def ensure_future_partitions(months_ahead: int = POSTS_PARTITION_MONTHS_AHEAD) -> list:
+    """
+    今月から months_ahead か月先までのパーティションが無ければ作成する。作成したテーブル名を返す
+    """
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        return []
+
+    created = []
+    this_month = datetime.now().date().replace(day=1)
+    with engine.begin() as connection:
+        existing = {month for month, _ in list_partitions(connection)}
+        for offset in range(months_ahead + 1):
+            month = add_months(this_month, offset)
+            if month not in existing:
+                create_partition(connection, month)
+                created.append(partition_name(month))
+    return created
+
+
+def archive_old_partitions(
+    archive_after_months: int = POSTS_ARCHIVE_AFTER_MONTHS, archive_dir: str = POSTS_ARCHIVE_DIR
+) -> list:
+    """
+    archive_after_months か月より古いパーティションを切り離し、
+    gzip圧縮したCSVとして archive_dir に保存してから削除する (post_feed の該当する行も削除する)。
+    アーカイブしたファイルのパスを返す
+
+    切り離しだけを短いトランザクションで行い、書き出しは切り離した後のテーブルから行うので、
+    書き出しの間も posts への読み書きは止まらない。
+    途中で止まった場合、切り離し済みのテーブルは次回の実行でアーカイブする
+    """
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        return []
+
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = add_months(datetime.now().date().replace(day=1), -archive_after_months)
+    archived = []
+    with engine.connect() as connection:
+        cold_partitions = [(month, name) for month, name in list_partitions(connection) if month < cutoff]
+        detached = [(month, name) for month, name in list_detached_partitions(connection) if month < cutoff]
+
+    for month, name in cold_partitions:
+        detach_partition(engine, name)
+    for month, name in sorted(detached + cold_partitions):
+        path = os.path.join(archive_dir, f"{name}.csv.gz")
+        raw_connection = engine.raw_connection()
+        try:
+            cursor = raw_connection.cursor()
+            with gzip.open(path, "wb") as f:
+                cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            raw_connection.commit()
+            cursor.execute(f"DROP TABLE {name}")
+            # 投稿一覧用の post_feed からも削除する
+            cursor.execute(
+                "DELETE FROM post_feed WHERE created_at >= %s AND created_at < %s", (month, add_months(month, 1))
+            )
+            raw_connection.commit()
+        except Exception:
+            raw_connection.rollback()
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        finally:
+            raw_connection.close()
+        archived.append(path)
+    return archived
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("maintain", "archive"):
+        sys.exit(__doc__)
+    if sys.argv[1] == "maintain":
+        print("作成したパーティション:", ensure_future_partitions())
+    else:
+        print("アーカイブしたパーティション:", archive_old_partitions())
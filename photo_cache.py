@@ -0,0 +1,265 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+# 写真キャッシュの保存先と容量上限 (バイト)
+PHOTO_CACHE_DIR = os.getenv("PHOTO_CACHE_DIR", "/tmp/sauna_photo_cache")
+PHOTO_CACHE_MAX_BYTES = int(os.getenv("PHOTO_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# 配信用のハードリンクが残っていたら削除するまでの時間と、確認する間隔 (秒)
+# (配信後に削除できなかったものだけが残る)
+PHOTO_SERVING_LINK_MAX_AGE = 60 * 60
+PHOTO_SERVING_SWEEP_INTERVAL = 10 * 60
+
+# 事前に用意するサイズ (px)。リクエストされた幅はこのいずれかに切り上げる
+PHOTO_SIZE_VARIANTS = (400, 800, 1600)
+
+
+def pick_size_variant(maxwidth: int) -> int:
+    """
+    リクエストされた幅を事前定義サイズに切り上げる
+    """
+    for size in PHOTO_SIZE_VARIANTS:
+        if maxwidth <= size:
+            return size
+    return PHOTO_SIZE_VARIANTS[-1]
+
+
+class PhotoCache:
+    """
+    写真のコンテンツアドレス型ディスクキャッシュ
+
+    - blobs/<sha256> に写真本体を保存 (同じ画像は1つだけ保存される)
+    - refs/<sha256(key)> に「キー → 写真本体のハッシュ」の対応を保存
+    - 合計サイズが max_bytes を超えたら最も古く使われた写真から削除 (LRU)。その写真を指す refs も削除する
+    - 同じキーの同時取得は1回の取得にまとめる
+    - 配信中の写真は serving/ のハードリンクから配信し、配信中に LRU で削除されても読み出せるようにする
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._blob_dir = os.path.join(root, "blobs")
+        self._ref_dir = os.path.join(root, "refs")
+        self._serving_dir = os.path.join(root, "serving")
+        os.makedirs(self._blob_dir, exist_ok=True)
+        os.makedirs(self._ref_dir, exist_ok=True)
+        os.makedirs(self._serving_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._blobs: "OrderedDict[str, int]" = OrderedDict()
+        # 写真本体のハッシュ → それを指す refs のファイル名
+        self._refs = {}
+        self._total_bytes = 0
+        self._inflight = {}
+        self._last_sweep = 0.0
+        self._load_existing_refs()
+        self._load_existing_blobs()
+        self._sweep_serving_links()
+
+    def _load_existing_refs(self):
+        for name in os.listdir(self._ref_dir):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                with open(os.path.join(self._ref_dir, name)) as f:
+                    digest = f.read().split("\t", 1)[0]
+            except OSError:
+                continue
+            self._refs.setdefault(digest, set()).add(name)
+
+    def _load_existing_blobs(self):
+        # 既存のファイルを最終アクセス順に並べて LRU の初期状態にする
+        entries = []
+        for name in os.listdir(self._blob_dir):
+            if name.endswith(".tmp"):
+                continue
+            stat = os.stat(os.path.join(self._blob_dir, name))
+            entries.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._blobs[name] = size
+            self._total_bytes += size
+        # 写真本体が無い refs は削除する
+        for digest in set(self._refs) - set(self._blobs):
+            self._remove_refs(digest)
+        self._evict()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self._blob_dir, digest)
+
+    def _ref_name(self, key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _ref_path(self, key: str) -> str:
+        return os.path.join(self._ref_dir, self._ref_name(key))
+
+    def _remove_refs(self, digest: str):
+        # self._lock を取得した状態で呼ぶ
+        for name in self._refs.pop(digest, ()):
+            try:
+                os.remove(os.path.join(self._ref_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, digest: str):
+        # self._lock を取得した状態で呼ぶ
+        if digest in self._blobs:
+            self._total_bytes -= self._blobs.pop(digest)
+        self._remove_refs(digest)
+
+    def _link(self, path: str, link_path: Optional[str]) -> bool:
+        # self._lock を取得した状態で呼ぶ (このプロセスでの削除と重ならないように)
+        if link_path is None:
+            return os.path.exists(path)
+        try:
+            os.link(path, link_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get(self, key: str, link_path: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """
+        キャッシュ済みの写真の (ファイルパス, Content-Type) を返す。無ければ None
+        link_path を指定すると、写真へのハードリンクをそのパスに作る
+        """
+        try:
+            with open(self._ref_path(key)) as f:
+                digest, media_type = f.read().split("\t", 1)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        path = self._blob_path(digest)
+        with self._lock:
+            self._refs.setdefault(digest, set()).add(self._ref_name(key))
+            if not self._link(path, link_path):
+                # 他のワーカーに削除されていた
+                self._forget(digest)
+                return None
+            if digest not in self._blobs:
+                # 他のワーカーが保存した写真ならインデックスに取り込む
+                size = os.path.getsize(path)
+                self._blobs[digest] = size
+                self._total_bytes += size
+            self._blobs.move_to_end(digest)
+        return path, media_type
+
+    def get_or_fetch(
+        self, key: str, fetcher: Callable[[], Tuple[bytes, str]], link_path: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """
+        キャッシュに無ければ fetcher で取得して保存する。
+        同じキーを同時に取得しようとした場合は最初の1回だけ fetcher を呼ぶ
+        """
+        cached = self.get(key, link_path)
+        if cached:
+            return cached
+
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is None:
+                entry = self._inflight[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                # 待っている間に他のスレッドが取得済みかもしれない
+                cached = self.get(key, link_path)
+                if cached:
+                    return cached
+                data, media_type = fetcher()
+                return self._store(key, data, media_type, link_path)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._inflight[key]
+
+    def link_or_fetch(self, key: str, fetcher: Callable[[], Tuple[bytes, str]]) -> Tuple[str, str]:
+        """
+        get_or_fetch() した写真の配信用ハードリンクを作り、(リンクのパス, Content-Type) を返す。
+        リンクは写真の確認・保存と同じロックの中で作るので、その後に LRU で削除されても配信できる。
+        リンクは配信後に unlink_served() で削除する
+        """
+        link_path = os.path.join(self._serving_dir, uuid.uuid4().hex)
+        _, media_type = self.get_or_fetch(key, fetcher, link_path)
+        self._sweep_serving_links()
+        return link_path, media_type
+
+    @staticmethod
+    def unlink_served(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _sweep_serving_links(self):
+        # 配信が中断されるなどして削除されなかったリンクをときどき削除する
+        with self._lock:
+            if time.monotonic() - self._last_sweep < PHOTO_SERVING_SWEEP_INTERVAL:
+                return
+            self._last_sweep = time.monotonic()
+        for name in os.listdir(self._serving_dir):
+            path = os.path.join(self._serving_dir, name)
+            try:
+                # リンクを作ると st_ctime が更新される
+                if time.time() - os.stat(path).st_ctime > PHOTO_SERVING_LINK_MAX_AGE:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _store(self, key: str, data: bytes, media_type: str, link_path: Optional[str] = None) -> Tuple[str, str]:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            self._atomic_write(path, data)
+        self._atomic_write(self._ref_path(key), f"{digest}\t{media_type}".encode())
+
+        with self._lock:
+            self._refs.setdefault(digest, set()).add(self._ref_name(key))
+            if digest not in self._blobs:
+                self._blobs[digest] = len(data)
+                self._total_bytes += len(data)
+            self._blobs.move_to_end(digest)
+            if not self._link(path, link_path):
+                # 書き込んだ直後に他のワーカーに削除された
+                self._atomic_write(path, data)
+                self._link(path, link_path)
+            self._evict()
+        return path, media_type
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        # 書き込み途中のファイルを配信しないように一時ファイルから置き換える
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        # 直近に保存した1件は残す (配信前に消さないため)
+        while self._total_bytes > self.max_bytes and len(self._blobs) > 1:
+            digest, size = self._blobs.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+            self._remove_refs(digest)
+
+
+_photo_cache: Optional[PhotoCache] = None
+_photo_cache_lock = threading.Lock()
+
+
+def get_photo_cache() -> PhotoCache:
+    """
+    写真キャッシュを取得する (初回アクセス時に初期化)
+    """
+    global _photo_cache
+    if _photo_cache is None:
+        with _photo_cache_lock:
+            if _photo_cache is None:
+                _photo_cache = PhotoCache(PHOTO_CACHE_DIR, PHOTO_CACHE_MAX_BYTES)
+    return _photo_cache
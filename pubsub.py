@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+import select
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+
+from database import DATABASE_URL, SessionLocal, get_engine
+from models import Post
+
+# 購読者ごとに溜めておけるイベント数 (超えた購読者は切断する)
+POSTS_STREAM_QUEUE_SIZE = int(os.getenv("POSTS_STREAM_QUEUE_SIZE", "100"))
+# 複数ワーカー間で PostgreSQL の LISTEN/NOTIFY を使ってイベントを共有するか
+POSTS_STREAM_PG_NOTIFY = os.getenv("POSTS_STREAM_PG_NOTIFY", "false").lower() in ("1", "true", "yes")
+PG_NOTIFY_CHANNEL = "sauna_posts"
+# NOTIFY のペイロード上限 (8000バイト) より少し小さい値
+PG_NOTIFY_MAX_PAYLOAD = 7900
+
+
+class Subscriber:
+    """
+    1つの接続 (SSE / WebSocket) の購読
+    """
+
+    def __init__(self, channel: str, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.channel = channel
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.lagged = False
+
+    def deliver(self, data: str):
+        # イベントループ上で呼ばれる
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # 読み出しが追いつかない購読者は溜まったイベントを捨てて切断する
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self) -> Optional[str]:
+        """
+        次のイベント (JSON文字列) を返す。読み出しが遅れて切断された場合は None
+        """
+        return await self.queue.get()
+
+
+class PostBroker:
+    """
+    プロセス内の非同期 pub/sub
+
+    publish() はどのスレッドからでも呼べる。配信はイベントループごとに1回だけ
+    コールバックを登録してまとめて行う
+    """
+
+    def __init__(self, queue_size: int = POSTS_STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str) -> Subscriber:
+        # イベントループ上で呼ぶ
+        subscriber = Subscriber(channel, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._channels.get(subscriber.channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._channels[subscriber.channel]
+
+    def subscriber_count(self, channel: Optional[str] = None) -> int:
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+    def publish(self, channel: str, data: str):
+        with self._lock:
+            subscribers = self._channels.get(channel)
+            loops = {subscriber.loop for subscriber in subscribers} if subscribers else set()
+        for loop in loops:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._fanout, loop, channel, data)
+
+    def _fanout(self, loop: asyncio.AbstractEventLoop, channel: str, data: str):
+        with self._lock:
+            subscribers = [s for s in self._channels.get(channel, ()) if s.loop is loop]
+        for subscriber in subscribers:
+            subscriber.deliver(data)
+
+
+class PgNotifyBridge:
+    """
+    PostgreSQL の LISTEN/NOTIFY で他のワーカーの投稿を受け取り、プロセス内に配信する
+    """
+
+    def __init__(self, broker: PostBroker):
+        self.broker = broker
+        self._thread = threading.Thread(target=self._run, name="pg-notify-bridge", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"LISTEN の接続が切れました。再接続します: {e}")
+                time.sleep(1)
+
+    def _listen(self):
+        import psycopg2
+
+        connection = psycopg2.connect(get_engine().url.set(drivername="postgresql").render_as_string(False))
+        try:
+            connection.autocommit = True
+            connection.cursor().execute(f"LISTEN {PG_NOTIFY_CHANNEL}")
+            while True:
+                if select.select([connection], [], [], 30) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    self._dispatch(connection.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+    def _dispatch(self, payload: str):
+        message = json.loads(payload)
+        if "events" in message:
+            events = [(event["channel"], event["data"]) for event in message["events"]]
+        else:
+            # ペイロードが大きすぎて投稿IDだけが送られた場合はDBから読み直す
+            events = load_post_events(message["post_ids"])
+        for channel, data in events:
+            self.broker.publish(channel, data)
+
+
+def _use_pg_notify() -> bool:
+    # LISTEN/NOTIFY は PostgreSQL の場合だけ使う (SQLite などでは設定されていてもプロセス内で配信する)
+    return POSTS_STREAM_PG_NOTIFY and bool(DATABASE_URL) and get_engine().dialect.name == "postgresql"
+
+
+_post_broker: Optional[PostBroker] = None
+_post_broker_lock = threading.Lock()
+
+
+def get_post_broker() -> PostBroker:
+    """
+    投稿ストリームの broker を取得する (初回アクセス時に初期化)
+    """
+    global _post_broker
+    if _post_broker is None:
+        with _post_broker_lock:
+            if _post_broker is None:
+                broker = PostBroker()
+                if _use_pg_notify():
+                    PgNotifyBridge(broker)
+                _post_broker = broker
+    return _post_broker
+
+
+def load_post_events(post_ids: list) -> list:
+    """
+    投稿をDBからまとめて読み込んで [(チャンネル, イベントのJSON文字列), ...] を作る
+    """
+    get_engine()
+    db = SessionLocal()
+    try:
+        posts = (
+            db.query(Post)
+            .options(joinedload(Post.user), joinedload(Post.sauna))
+            .filter(Post.id.in_(post_ids))
+            .order_by(Post.id)
+            .all()
+        )
+        return [
+            (post.sauna_id, json.dumps(post_event(post, post.user.name, post.sauna.name), ensure_ascii=False, default=str))
+            for post in posts
+        ]
+    finally:
+        db.close()
+
+
+def post_event(post, user_name: Optional[str], sauna_name: str) -> dict:
+    """
+    投稿を GET /posts と同じ形の辞書にする
+    """
+    return {
+        "id": post.id,
+        "content": post.content,
+        "created_at": post.created_at.isoformat() if post.created_at else None,
+        "user": {
+            "id": post.user_id,
+            "name": user_name,
+        },
+        "sauna": {
+            "id": post.sauna_id,
+            "name": sauna_name,
+        },
+    }
+
+
+def publish_posts(events: list):
+    """
+    コミット済みの投稿 (post_event() のリスト) を購読者に配信する
+
+    PostgreSQL の NOTIFY を使う場合も一括登録の投稿はまとめて1回で送る。
+    配信に失敗しても投稿はコミット済みなので、エラーにはせずログだけ出す
+    """
+    if not events:
+        return
+    try:
+        _publish_posts(events)
+    except Exception as e:
+        print(f"投稿の配信に失敗しました ({len(events)}件): {e}")
+
+
+def _publish_posts(events: list):
+    messages = [
+        {"channel": event["sauna"]["id"], "data": json.dumps(event, ensure_ascii=False, default=str)}
+        for event in events
+    ]
+    if not _use_pg_notify():
+        broker = get_post_broker()
+        for message in messages:
+            broker.publish(message["channel"], message["data"])
+        return
+
+    # 自分のプロセスにも LISTEN 経由で届くので、ここでは直接配信しない
+    payload = json.dumps({"events": messages}, ensure_ascii=False)
+    if len(payload.encode()) > PG_NOTIFY_MAX_PAYLOAD:
+        payload = json.dumps({"post_ids": [event["id"] for event in events]})
+    with get_engine().begin() as connection:
+        connection.execute(
+            text("SELECT pg_notify(:channel, :payload)"), {"channel": PG_NOTIFY_CHANNEL, "payload": payload}
+        )
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+from starlette.routing import compile_path
+
+# ルートごとのレート制限 "メソッド パス": (1秒あたりの回数, バースト)
+# RATE_LIMITS_JSON で上書きできる (例: '{"GET /saunas": [0.5, 5]}')
+DEFAULT_RATE_LIMITS = {
+    "GET /saunas": (1.0, 10),  # Google テキスト検索
+    "GET /saunas/{place_id}": (2.0, 20),
+    "GET /saunas/{place_id}/photos/{n}": (5.0, 30),
+    "POST /posts": (0.5, 10),
+    "POST /posts/batch": (0.1, 3),
+    "POST /favorites": (0.5, 10),
+    "POST /favorites/batch": (0.1, 3),
+}
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.getenv("RATE_LIMITS_JSON", "{}"))}
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# 複数ワーカーでレート制限を共有する場合の Redis (未設定ならプロセス内で制限する)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Redis への接続・応答を待つ最大秒数 (止まっている間はプロセス内で制限する)
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", "0.5"))
+# アプリの前にある信頼できるプロキシの数 (X-Forwarded-For を付け足すもの。Vercel なら 1)
+# 0 なら X-Forwarded-For は使わず、接続元のIPで制限する
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+# Redis のエラーをログに出す間隔 (秒)
+RATE_LIMIT_ERROR_LOG_INTERVAL = 60
+
+# 同時に処理するリクエスト数と、空きを待てるリクエスト数・待ち時間 (秒)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "40"))
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "100"))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "5"))
+
+
+class InMemoryTokenBucket:
+    """
+    プロセス内のトークンバケット
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def acquire(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        """
+        トークンを1つ消費する。(許可されたか, 次に許可されるまでの秒数) を返す
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (1 - tokens) / rate
+            self._prune(now)
+        return allowed, retry_after
+
+    def _prune(self, now: float):
+        # 満タンに戻っているはずの古いバケットを定期的に削除する
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for key, (_, updated_at) in list(self._buckets.items()):
+            if now - updated_at > 600:
+                del self._buckets[key]
+
+
+class RedisTokenBucket:
+    """
+    Redis 上のトークンバケット (複数ワーカー・インスタンスで共有)
+
+    Redis のエラーやタイムアウトの間は、プロセス内のトークンバケットで制限する
+    """
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - updated_at) * rate)
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, client):
+        self._script = client.register_script(self.SCRIPT)
+        self._fallback = InMemoryTokenBucket()
+        self._last_error_logged = 0.0
+        try:
+            from redis.exceptions import RedisError
+
+            self._errors = (RedisError, OSError)
+        except ImportError:
+            self._errors = (OSError,)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisTokenBucket":
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("RATE_LIMIT_REDIS_URL を指定する場合は redis パッケージが必要です")
+        return cls(
+            redis.Redis.from_url(
+                url, socket_timeout=RATE_LIMIT_REDIS_TIMEOUT, socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT
+            )
+        )
+
+    def acquire(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        try:
+            allowed, retry_after = self._script(keys=[f"ratelimit:{key}"], args=[rate, burst])
+        except self._errors as e:
+            now = time.monotonic()
+            if now - self._last_error_logged >= RATE_LIMIT_ERROR_LOG_INTERVAL:
+                self._last_error_logged = now
+                print(f"レート制限の Redis を利用できません。プロセス内で制限します: {e!r}")
+            return self._fallback.acquire(key, rate, burst)
+        return bool(allowed), float(retry_after)
+
+
+async def _send_error(send, status_code: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+    ]
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def client_key(scope) -> str:
+    """
+    レート制限のキー (IP単位)
+
+    X-Forwarded-For の左側はクライアントが自由に書けるため、RATE_LIMIT_TRUSTED_PROXIES が
+    設定されている場合だけ、信頼できるプロキシが付け足した右側から数えた値を使う。
+    user_id (クエリ・X-User-Id ヘッダー) は認証されておらず、リクエストごとに変えれば
+    制限を回避できるため使わない
+    """
+    if RATE_LIMIT_TRUSTED_PROXIES > 0:
+        forwarded = dict(scope.get("headers", [])).get(b"x-forwarded-for", b"").decode()
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if len(hops) >= RATE_LIMIT_TRUSTED_PROXIES:
+            return f"ip:{hops[-RATE_LIMIT_TRUSTED_PROXIES]}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """
+    ルートごとのレート制限。超えた場合は 429 と Retry-After を返す
+    """
+
+    def __init__(self, app, limits: Optional[dict] = None, backend=None):
+        self.app = app
+        self.rules = []
+        for rule, (rate, burst) in (limits or RATE_LIMITS).items():
+            method, path = rule.split(" ", 1)
+            regex, _, _ = compile_path(path)
+            self.rules.append((method, regex, rule, float(rate), float(burst)))
+        if backend is None:
+            backend = RedisTokenBucket.from_url(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else InMemoryTokenBucket()
+        self.backend = backend
+
+    def _match(self, scope):
+        for method, regex, rule, rate, burst in self.rules:
+            if scope["method"] == method and regex.match(scope["path"]):
+                return rule, rate, burst
+        return None
+
+    async def __call__(self, scope, receive, send):
+        matched = self._match(scope) if scope["type"] == "http" else None
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+
+        rule, rate, burst = matched
+        key = f"{rule}:{client_key(scope)}"
+        if isinstance(self.backend, InMemoryTokenBucket):
+            allowed, retry_after = self.backend.acquire(key, rate, burst)
+        else:
+            allowed, retry_after = await asyncio.to_thread(self.backend.acquire, key, rate, burst)
+        if not allowed:
+            await _send_error(send, 429, "リクエストが多すぎます。しばらく待ってから再度お試しください。", retry_after)
+            return
+        await self.app(scope, receive, send)
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    同時に処理するリクエスト数を制限する。
+    上限を超えたリクエストは最大 max_queued 件まで待たせ、それ以上や待ち時間切れは 503 を返す
+    """
+
+    def __init__(
+        self,
+        app,
+        max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+        max_queued: int = MAX_QUEUED_REQUESTS,
+        queue_timeout: float = QUEUE_TIMEOUT,
+    ):
+        self.app = app
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._queued = 0
+
+    async def __call__(self, scope, receive, send):
+        # 長時間つながるストリームは対象外
+        if scope["type"] != "http" or scope["path"].endswith("/posts/stream"):
+            await self.app(scope, receive, send)
+            return
+
+        if self._semaphore.locked():
+            if self._queued >= self.max_queued:
+                await _send_error(send, 503, "サーバーが混み合っています。", self.queue_timeout)
+                return
+            self._queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                await _send_error(send, 503, "サーバーが混み合っています。", self.queue_timeout)
+                return
+            finally:
+                self._queued -= 1
+        else:
+            await self._semaphore.acquire()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._semaphore.release()
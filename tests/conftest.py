@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import uuid
+
+# ルート直下のモジュールを import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main / database は import 時に環境変数を読むので、テスト用の値を先に設定する
+_tmp_dir = tempfile.mkdtemp(prefix="sauna-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_dir}/app.db")
+os.environ.setdefault("GOOGLE_PLACES_API_KEY", "test")
+os.environ.setdefault("PHOTO_CACHE_DIR", f"{_tmp_dir}/photos")
+os.environ.setdefault("SQL_ECHO", "false")
+# レート制限は tests/test_ratelimit.py で個別に確認する
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import pytest  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine, text  # noqa: E402
+
+import database  # noqa: E402
+from models import Base  # noqa: E402
+
+
+def _bind(engine, monkeypatch):
+    # engine をアプリの接続先にし、終わったら元に戻す
+    previous_bind = database.SessionLocal.kw.get("bind")
+    database.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(database, "_engine", engine)
+    yield engine
+    database.SessionLocal.configure(bind=previous_bind)
+    engine.dispose()
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """
+    テストごとの SQLite データベース (全テーブル作成済み) をアプリの接続先にする
+    """
+    engine = create_engine(f"sqlite:///{tmp_path}/app.db")
+    Base.metadata.create_all(engine)
+    yield from _bind(engine, monkeypatch)
+
+
+@pytest.fixture
+def postgres_engine(monkeypatch):
+    """
+    TEST_POSTGRES_URL の PostgreSQL に一時的なスキーマを作ってアプリの接続先にする (未設定ならスキップ)
+    """
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL が設定されていません")
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    admin_engine = create_engine(url)
+    with admin_engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    Base.metadata.create_all(engine)
+    try:
+        yield from _bind(engine, monkeypatch)
+    finally:
+        with admin_engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin_engine.dispose()
+
+
+@pytest.fixture
+def google_calls(monkeypatch):
+    """
+    Google Places API の詳細取得の代わりに、place_id から作ったサウナを返す
+    (place_id が missing で始まる場合は 404)。呼び出された place_id のリストを返す
+    """
+    import main
+
+    calls = []
+
+    def fetch_sauna_details_from_google(place_id):
+        calls.append(place_id)
+        if place_id.startswith("missing"):
+            raise HTTPException(status_code=404, detail="指定されたplace_idに対応するサウナ情報が見つかりません")
+        return {
+            "id": place_id,
+            "name": f"サウナ {place_id}",
+            "address": "東京都",
+            "prefecture": "東京都",
+            "latitude": 35.68,
+            "longitude": 139.76,
+        }
+
+    monkeypatch.setattr(main, "fetch_sauna_details_from_google", fetch_sauna_details_from_google)
+    return calls
+
+
+@pytest.fixture
+def client(engine, google_calls):
+    import main
+
+    return TestClient(main.app)
@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+
+
+@pytest.fixture
+def users(client):
+    for user_id in ("u1", "u2"):
+        assert client.post("/users", json={"id": user_id, "email": f"{user_id}@example.com", "name": user_id}).status_code == 200
+
+
+@contextmanager
+def count_statements(engine):
+    statements = []
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_posts_batch_returns_results_in_request_order(client, users, google_calls):
+    items = [
+        {"user_id": "u1", "sauna_id": "s1", "content": "0"},
+        {"user_id": "nobody", "sauna_id": "s1", "content": "1"},
+        {"user_id": "u2", "sauna_id": "missing", "content": "2"},
+        {"user_id": "u2", "sauna_id": "s2", "content": "3"},
+    ]
+    results = client.post("/posts/batch", json=items).json()["results"]
+
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert [result["status"] for result in results] == ["created", "error", "error", "created"]
+    assert [(result.get("status_code"), result.get("detail")) for result in results[1:3]] == [
+        (404, "User not found"),
+        (404, "指定されたplace_idに対応するサウナ情報が見つかりません"),
+    ]
+    assert [(result["post"]["user_id"], result["post"]["content"]) for result in (results[0], results[3])] == [
+        ("u1", "0"),
+        ("u2", "3"),
+    ]
+    assert results[0]["post"]["id"] < results[3]["post"]["id"]
+
+
+def test_unknown_sauna_is_fetched_once(client, users, google_calls):
+    client.post("/posts", json={"user_id": "u1", "sauna_id": "known", "content": "a"})
+    google_calls.clear()
+
+    items = [{"user_id": "u1", "sauna_id": sauna_id, "content": "b"} for sauna_id in ["new1", "known", "new2", "new1", "new2"]]
+    results = client.post("/posts/batch", json=items).json()["results"]
+    assert all(result["status"] == "created" for result in results)
+    assert sorted(google_calls) == ["new1", "new2"]
+    # 登録済みになったサウナは次のリクエストで取得しない
+    client.post("/posts/batch", json=items)
+    assert sorted(google_calls) == ["new1", "new2"]
+
+
+def test_favorites_batch_rejects_duplicates(client, users, google_calls):
+    assert client.post("/favorites", json={"user_id": "u1", "sauna_id": "s1"}).status_code == 200
+    items = [
+        {"user_id": "u1", "sauna_id": "s1"},  # 登録済み
+        {"user_id": "u1", "sauna_id": "s2"},
+        {"user_id": "u1", "sauna_id": "s2"},  # 同じリクエスト内の重複
+        {"user_id": "u2", "sauna_id": "s2"},
+        {"user_id": "nobody", "sauna_id": "s3"},
+    ]
+    results = client.post("/favorites/batch", json=items).json()["results"]
+    assert [(result["status"], result.get("status_code")) for result in results] == [
+        ("error", 400),
+        ("created", None),
+        ("error", 400),
+        ("created", None),
+        ("error", 404),
+    ]
+    favorites = client.get("/favorites", params={"user_id": "u1"}).json()["favorites"]
+    assert sorted(favorite["sauna_id"] for favorite in favorites) == ["s1", "s2"]
+
+
+def test_batch_too_large(client, users, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_ITEMS", 2)
+    items = [{"user_id": "u1", "sauna_id": "s1", "content": "a"}] * 3
+    assert client.post("/posts/batch", json=items).status_code == 413
+    assert client.post("/favorites/batch", json=[{"user_id": "u1", "sauna_id": "s1"}] * 3).status_code == 413
+
+
+def make_items(path, count, prefix):
+    if path == "/favorites/batch":
+        # 重複にならないようにサウナは要素ごとに変える
+        return [{"user_id": f"u{index % 2 + 1}", "sauna_id": f"{prefix}{index}"} for index in range(count)]
+    return [
+        {"user_id": f"u{index % 2 + 1}", "sauna_id": f"{prefix}{index % 50}", "content": str(index)}
+        for index in range(count)
+    ]
+
+
+def batch_statement_counts(client, engine, path):
+    counts = []
+    for count, prefix in ((10, "a"), (200, "b")):
+        with count_statements(engine) as statements:
+            results = client.post(path, json=make_items(path, count, prefix)).json()["results"]
+        assert all(result["status"] == "created" for result in results)
+        counts.append(statements)
+    return counts
+
+
+@pytest.mark.parametrize("path", ["/posts/batch", "/favorites/batch"])
+def test_batch_statement_count_does_not_grow_with_items(client, users, engine, path):
+    # 未登録のサウナを含む200件でも、確認・Google からの取得・post_feed への登録は要素ごとにクエリを発行しない
+    # (SQLite は RETURNING の順番を保証する方法が無いため、SQLAlchemy が posts / favorites の INSERT を1行ずつ実行する)
+    table = "posts" if path == "/posts/batch" else "favorites"
+    small, large = (
+        [statement for statement in statements if not statement.startswith(f"INSERT INTO {table} ")]
+        for statements in batch_statement_counts(client, engine, path)
+    )
+    assert len(large) == len(small) <= 5
+
+
+@pytest.mark.parametrize("path", ["/posts/batch", "/favorites/batch"])
+def test_batch_round_trips_on_postgres(postgres_engine, google_calls, path):
+    client = TestClient(main.app)
+    for user_id in ("u1", "u2"):
+        client.post("/users", json={"id": user_id, "email": f"{user_id}@example.com", "name": user_id})
+    small, large = batch_statement_counts(client, postgres_engine, path)
+    assert len(large) == len(small) <= 6
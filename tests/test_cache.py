@@ -0,0 +1,71 @@
+import time
+
+import fakeredis
+import pytest
+import redis
+
+from cache import MISSING, LocalCache, RedisCache, SQLiteCache, TieredCache
+
+
+@pytest.fixture(params=["redis", "sqlite"])
+def shared(request, tmp_path):
+    if request.param == "redis":
+        return RedisCache(fakeredis.FakeRedis())
+    return SQLiteCache(str(tmp_path / "cache.db"))
+
+
+def test_shared_cache_roundtrip(shared):
+    assert shared.get("a") is MISSING
+    shared.set("a", {"name": "サウナ", "ids": [1, 2]})
+    assert shared.get("a") == {"name": "サウナ", "ids": [1, 2]}
+    shared.set("none", None)
+    assert shared.get("none") is None
+    shared.delete("a")
+    assert shared.get("a") is MISSING
+
+
+def test_shared_cache_ttl_below_one_second(shared):
+    shared.set("short", 1, ttl=0.2)
+    assert shared.get("short") == 1
+    time.sleep(0.3)
+    assert shared.get("short") is MISSING
+
+
+def test_namespace_invalidate_across_processes(shared):
+    # 2つのプロセスが同じ共有キャッシュを使う想定
+    first = TieredCache(LocalCache(), shared, local_ttl=0.1).namespace("tiles")
+    second = TieredCache(LocalCache(), shared, local_ttl=0.1).namespace("tiles")
+    first.set("1/2/3", "tile")
+    assert second.get("1/2/3") == "tile"
+
+    second.invalidate()
+    time.sleep(0.15)
+    assert first.get("1/2/3") is MISSING
+    assert second.get_or_set("1/2/3", lambda: "rebuilt") == "rebuilt"
+    assert first.get("1/2/3") == "rebuilt"
+
+
+class BrokenRedis:
+    def get(self, *args, **kwargs):
+        raise redis.exceptions.ConnectionError("down")
+
+    set = delete = get
+
+
+def test_redis_errors_are_misses():
+    cache = TieredCache(LocalCache(), RedisCache(BrokenRedis()))
+    namespace = cache.namespace("place_details")
+    assert namespace.get("p1") is MISSING
+    namespace.set("p1", {"name": "S"})
+    namespace.delete("p1")
+    assert namespace.get_or_set("p2", lambda: "loaded") == "loaded"
+    namespace.invalidate()
+
+
+def test_sqlite_errors_are_misses(tmp_path):
+    shared = SQLiteCache(str(tmp_path / "cache.db"))
+    shared._conn.close()
+    assert shared.get("a") is MISSING
+    shared.set("a", 1)
+    shared.delete("a")
+    shared.purge_expired()
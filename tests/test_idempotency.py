@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyMiddleware
+
+BODY = json.dumps({"content": "a" * 1000}).encode()
+
+
+class PostBody(BaseModel):
+    content: str
+
+
+@pytest.fixture
+def app(engine):
+    app = FastAPI()
+    app.state.created = []
+
+    @app.post("/posts")
+    def create_post(post: PostBody):
+        app.state.created.append(post.content)
+        return {"id": len(app.state.created)}
+
+    app.add_middleware(IdempotencyMiddleware, routes={("POST", "/posts")})
+    return app
+
+
+def post(client, body, key="k1"):
+    return client.post("/posts", content=body, headers={IDEMPOTENCY_HEADER: key, "Content-Type": "application/json"})
+
+
+def test_retry_is_replayed(app):
+    client = TestClient(app)
+    first, second = post(client, BODY), post(client, BODY)
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers[REPLAYED_HEADER] == "true"
+    assert len(app.state.created) == 1
+
+
+def test_disconnect_during_upload_does_not_claim_key(app):
+    # ボディの途中でクライアントが切断したリクエスト
+    messages = [
+        {"type": "http.request", "body": BODY[:100], "more_body": True},
+        {"type": "http.disconnect"},
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/posts",
+        "headers": [(IDEMPOTENCY_HEADER.lower().encode(), b"k1"), (b"content-type", b"application/json")],
+        "query_string": b"",
+    }
+    asyncio.run(app(scope, receive, send))
+    assert sent == []
+    assert app.state.created == []
+
+    # 同じキーで全体を再送すれば処理される
+    response = post(TestClient(app), BODY)
+    assert response.status_code == 200
+    assert REPLAYED_HEADER not in response.headers
+    assert len(app.state.created) == 1
+
+
+def test_client_error_is_not_stored(app):
+    client = TestClient(app)
+    assert post(client, BODY[:100]).status_code == 422
+    # 正しいボディで再送すれば、前回のボディとの不一致 (422) にならずに処理される
+    response = post(client, BODY)
+    assert response.status_code == 200
+    assert len(app.state.created) == 1
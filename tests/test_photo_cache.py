@@ -0,0 +1,43 @@
+import os
+
+from fastapi.testclient import TestClient
+
+import main
+from photo_cache import PhotoCache
+
+
+def test_served_link_survives_eviction(tmp_path):
+    cache = PhotoCache(str(tmp_path), max_bytes=10)
+    path, media_type = cache.link_or_fetch("a", lambda: (b"0123456789", "image/jpeg"))
+    # 別の写真の保存で a が LRU から削除されても、配信用のリンクは読み出せる
+    cache.get_or_fetch("b", lambda: (b"abcdefghij", "image/png"))
+    assert cache.get("a") is None
+    with open(path, "rb") as f:
+        assert f.read() == b"0123456789"
+    assert media_type == "image/jpeg"
+
+    cache.unlink_served(path)
+    assert os.listdir(tmp_path / "serving") == []
+
+
+def test_missing_blob_is_fetched_again(tmp_path):
+    cache = PhotoCache(str(tmp_path), max_bytes=100)
+    cache.get_or_fetch("a", lambda: (b"old", "image/jpeg"))
+    # 他のワーカーが写真本体を削除した
+    for name in os.listdir(tmp_path / "blobs"):
+        os.remove(tmp_path / "blobs" / name)
+    path, _ = cache.link_or_fetch("a", lambda: (b"new", "image/jpeg"))
+    with open(path, "rb") as f:
+        assert f.read() == b"new"
+
+
+def test_photo_endpoint_removes_link_after_response(tmp_path, monkeypatch):
+    cache = PhotoCache(str(tmp_path), max_bytes=100)
+    monkeypatch.setattr(main, "get_photo_cache", lambda: cache)
+    monkeypatch.setattr(main, "fetch_sauna_photo_from_google", lambda place_id, n, size: (b"IMG", "image/jpeg"))
+    response = TestClient(main.app).get("/saunas/p1/photos/0?maxwidth=500")
+    assert response.status_code == 200
+    assert response.content == b"IMG"
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["cache-control"] == "public, max-age=86400"
+    assert os.listdir(tmp_path / "serving") == []
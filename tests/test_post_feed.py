@@ -0,0 +1,127 @@
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+import warmup
+from models import Post, PostFeed, Sauna, User
+
+
+def assert_feed_matches_posts(engine):
+    # post_feed は posts / users / saunas を結合した結果と常に一致する
+    with engine.connect() as connection:
+        expected = connection.execute(
+            select(Post.id, Post.user_id, Post.sauna_id, Post.content, Post.created_at, User.name, Sauna.name)
+            .join(User, User.id == Post.user_id)
+            .join(Sauna, Sauna.id == Post.sauna_id)
+            .order_by(Post.id)
+        ).all()
+        actual = connection.execute(
+            select(
+                PostFeed.post_id,
+                PostFeed.user_id,
+                PostFeed.sauna_id,
+                PostFeed.content,
+                PostFeed.created_at,
+                PostFeed.user_name,
+                PostFeed.sauna_name,
+            ).order_by(PostFeed.post_id)
+        ).all()
+    assert actual == expected
+    return actual
+
+
+def create_user(client, user_id="u1", name="サウナー"):
+    assert client.post("/users", json={"id": user_id, "email": f"{user_id}@example.com", "name": name}).status_code == 200
+
+
+def test_create_post_adds_full_content_to_feed(client, engine):
+    create_user(client)
+    content = "ととのった" * 400
+    response = client.post("/posts", json={"user_id": "u1", "sauna_id": "s1", "content": content})
+    assert response.status_code == 200
+
+    rows = assert_feed_matches_posts(engine)
+    assert len(rows) == 1
+    posts = client.get("/posts").json()
+    assert posts[0]["content"] == content
+    assert posts[0]["user"] == {"id": "u1", "name": "サウナー"}
+    assert posts[0]["sauna"] == {"id": "s1", "name": "サウナ s1"}
+
+
+def test_batch_adds_only_created_posts_to_feed(client, engine):
+    create_user(client)
+    response = client.post(
+        "/posts/batch",
+        json=[
+            {"user_id": "u1", "sauna_id": "s1", "content": "1"},
+            {"user_id": "nobody", "sauna_id": "s1", "content": "2"},
+            {"user_id": "u1", "sauna_id": "missing", "content": "3"},
+            {"user_id": "u1", "sauna_id": "s2", "content": "4"},
+        ],
+    )
+    assert [result["status"] for result in response.json()["results"]] == ["created", "error", "error", "created"]
+
+    rows = assert_feed_matches_posts(engine)
+    assert [row.content for row in rows] == ["1", "4"]
+
+
+def test_delete_post_removes_it_from_feed(client, engine):
+    create_user(client)
+    post_ids = [
+        client.post("/posts", json={"user_id": "u1", "sauna_id": "s1", "content": str(i)}).json()["post"]["id"]
+        for i in range(2)
+    ]
+    assert client.delete(f"/posts/{post_ids[0]}").status_code == 200
+
+    rows = assert_feed_matches_posts(engine)
+    assert [row.post_id for row in rows] == post_ids[1:]
+
+
+def test_user_rename_updates_feed(client, engine):
+    create_user(client, "u1", "before")
+    create_user(client, "u2", "other")
+    client.post("/posts", json={"user_id": "u1", "sauna_id": "s1", "content": "a"})
+    client.post("/posts", json={"user_id": "u2", "sauna_id": "s1", "content": "b"})
+    create_user(client, "u1", "after")
+
+    rows = assert_feed_matches_posts(engine)
+    assert [row.user_name for row in rows] == ["after", "other"]
+
+
+def test_warmup_sauna_rename_updates_feed(client, engine):
+    create_user(client)
+    client.post("/posts", json={"user_id": "u1", "sauna_id": "s1", "content": "a"})
+    client.post("/posts", json={"user_id": "u1", "sauna_id": "s2", "content": "b"})
+    warmup.upsert_saunas(
+        [{"id": "s1", "name": "新しい名前", "address": "東京都", "prefecture": "東京都", "latitude": 35.68, "longitude": 139.76}]
+    )
+
+    rows = assert_feed_matches_posts(engine)
+    assert [row.sauna_name for row in rows] == ["新しい名前", "サウナ s2"]
+
+
+def test_get_posts_order_and_time_range(client, engine):
+    create_user(client)
+    post_ids = [
+        client.post("/posts", json={"user_id": "u1", "sauna_id": "s1", "content": str(i)}).json()["post"]["id"]
+        for i in range(4)
+    ]
+    # 投稿日時を id とは逆の順番にし、2件は同じ日時にする
+    created_at = {
+        post_ids[0]: datetime(2026, 3, 1),
+        post_ids[1]: datetime(2026, 2, 1),
+        post_ids[2]: datetime(2026, 1, 1),
+        post_ids[3]: datetime(2026, 2, 1),
+    }
+    with engine.begin() as connection:
+        for post_id, value in created_at.items():
+            connection.execute(update(Post).where(Post.id == post_id).values(created_at=value))
+            connection.execute(update(PostFeed).where(PostFeed.post_id == post_id).values(created_at=value))
+    assert_feed_matches_posts(engine)
+
+    # 古い順、同じ日時なら id 順
+    assert [post["id"] for post in client.get("/posts").json()] == [post_ids[2], post_ids[1], post_ids[3], post_ids[0]]
+    # since は指定日時を含み、until は含まない
+    response = client.get("/posts", params={"since": "2026-02-01T00:00:00", "until": "2026-03-01T00:00:00"})
+    assert [post["id"] for post in response.json()] == [post_ids[1], post_ids[3]]
+    assert [post["id"] for post in client.get("/posts", params={"sauna_id": "s2"}).json()] == []
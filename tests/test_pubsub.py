@@ -0,0 +1,18 @@
+import json
+import threading
+
+import pubsub
+
+
+def test_pg_notify_is_not_used_on_sqlite(engine, monkeypatch):
+    monkeypatch.setattr(pubsub, "POSTS_STREAM_PG_NOTIFY", True)
+    monkeypatch.setattr(pubsub, "_post_broker", None)
+    broker = pubsub.get_post_broker()
+    assert "pg-notify-bridge" not in [thread.name for thread in threading.enumerate()]
+
+    # プロセス内の購読者にそのまま配信される
+    published = []
+    monkeypatch.setattr(broker, "publish", lambda channel, data: published.append((channel, json.loads(data))))
+    event = {"id": 1, "content": "hi", "created_at": None, "user": {"id": "u1", "name": "n"}, "sauna": {"id": "s1", "name": "S"}}
+    pubsub.publish_posts([event])
+    assert published == [("s1", event)]
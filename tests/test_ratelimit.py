@@ -0,0 +1,49 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import ratelimit
+from ratelimit import InMemoryTokenBucket, RateLimitMiddleware, RedisTokenBucket
+
+
+def make_client(backend=None):
+    app = FastAPI()
+
+    @app.post("/posts")
+    def create_post():
+        return {"ok": True}
+
+    app.add_middleware(
+        RateLimitMiddleware, limits={"POST /posts": (0.001, 2)}, backend=backend or InMemoryTokenBucket()
+    )
+    return TestClient(app)
+
+
+def test_user_id_does_not_bypass_limit():
+    # user_id を変えても同じIPなら同じバケットになる
+    client = make_client()
+    statuses = [
+        client.post(f"/posts?user_id=u{i}", headers={"X-User-Id": f"h{i}"}).status_code for i in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+
+
+def test_forged_forwarded_for_does_not_bypass_limit():
+    client = make_client()
+    statuses = [client.post("/posts", headers={"X-Forwarded-For": f"10.0.0.{i}"}).status_code for i in range(3)]
+    assert statuses == [200, 200, 429]
+
+
+def test_trusted_proxy_hop_is_used(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUSTED_PROXIES", 1)
+    client = make_client()
+    # 左側 (クライアントが書いた値) を変えても、プロキシが付け足した右端が同じなら同じバケットになる
+    for i in range(2):
+        assert client.post("/posts", headers={"X-Forwarded-For": f"1.1.1.{i}, 10.0.0.1"}).status_code == 200
+    assert client.post("/posts", headers={"X-Forwarded-For": "1.1.1.9, 10.0.0.1"}).status_code == 429
+    assert client.post("/posts", headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 200
+
+
+def test_redis_outage_falls_back_to_process_limit(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_REDIS_TIMEOUT", 0.1)
+    client = make_client(RedisTokenBucket.from_url("redis://127.0.0.1:1/0"))
+    assert [client.post("/posts").status_code for _ in range(3)] == [200, 200, 429]
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from starlette.requests import Request
+
+import database
+from database import LAST_WRITE_HEADER, ReplicaPool, get_read_db
+from models import Base, User
+
+
+def make_database(path, name=None):
+    url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    if name is not None:
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO users (id, email, name) VALUES ('u1', 'e', :name)"), {"name": name})
+    return url
+
+
+def request_with(headers=None):
+    raw_headers = [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/users", "headers": raw_headers})
+
+
+def read_user_name(request):
+    dependency = get_read_db(request)
+    db = next(dependency)
+    try:
+        return db.query(User.name).filter(User.id == "u1").scalar()
+    finally:
+        dependency.close()
+
+
+@pytest.fixture
+def databases(engine, monkeypatch):
+    # プライマリとレプリカで別の値を入れておき、どちらから読んだかを見分ける
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO users (id, email, name) VALUES ('u1', 'e', 'primary')"))
+
+    def use_replicas(*urls):
+        monkeypatch.setattr(database, "_replica_pool", ReplicaPool(list(urls)))
+
+    return use_replicas
+
+
+def test_reads_go_to_replica(databases, tmp_path):
+    databases(make_database(tmp_path / "replica.db", "replica"))
+    assert read_user_name(request_with()) == "replica"
+
+
+def test_recent_write_reads_primary_until_staleness_window_passes(databases, tmp_path, monkeypatch):
+    databases(make_database(tmp_path / "replica.db", "replica"))
+    monkeypatch.setattr(database, "REPLICA_STALENESS_SECONDS", 0.2)
+    last_write = {LAST_WRITE_HEADER: f"{time.time():.3f}"}
+    assert read_user_name(request_with(last_write)) == "primary"
+    time.sleep(0.3)
+    assert read_user_name(request_with(last_write)) == "replica"
+
+
+def test_unreachable_replica_is_skipped(databases, tmp_path):
+    databases(f"sqlite:///{tmp_path}/missing/replica.db", make_database(tmp_path / "replica.db", "replica"))
+    assert [read_user_name(request_with()) for _ in range(4)] == ["replica"] * 4
+
+
+def test_failed_replica_query_falls_back_to_primary(databases, tmp_path):
+    # SELECT 1 は通るがテーブルが無いレプリカ
+    databases(make_database(tmp_path / "empty.db"))
+    assert read_user_name(request_with()) == "primary"
+    # 失敗したレプリカは次のヘルスチェックまで使わない
+    assert database.get_replica_pool().choose() is None
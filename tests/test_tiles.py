@@ -0,0 +1,88 @@
+import pytest
+
+import cache
+import database
+import tiles
+from models import Sauna
+from tiles import TILE_CLUSTER_MAX_ZOOM, build_tile, tile_bounds, tile_for_point
+
+
+@pytest.fixture
+def db(engine, monkeypatch):
+    # タイルのキャッシュを他のテストと共有しない
+    monkeypatch.setattr(cache, "_cache", None)
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+
+def add_saunas(db, *points):
+    for index, (latitude, longitude) in enumerate(points):
+        db.add(Sauna(id=f"s{index}", name=f"s{index}", address="", prefecture="", latitude=latitude, longitude=longitude))
+    db.commit()
+
+
+def test_tile_bounds():
+    south, west, north, east = tile_bounds(0, 0, 0)
+    assert (west, east) == (-180.0, 180.0)
+    assert south == pytest.approx(-tiles.MAX_LATITUDE) and north == pytest.approx(tiles.MAX_LATITUDE)
+    assert tile_bounds(1, 1, 0) == pytest.approx((0.0, 0.0, tiles.MAX_LATITUDE, 180.0))
+
+
+@pytest.mark.parametrize("z", [0, 5, 13, 22])
+@pytest.mark.parametrize("latitude, longitude", [(35.6812, 139.7671), (-33.8688, 151.2093), (89.9, -179.9)])
+def test_point_is_inside_its_tile(z, latitude, longitude):
+    south, west, north, east = tile_bounds(z, *tile_for_point(z, latitude, longitude))
+    assert south <= min(latitude, north) <= north
+    assert west <= longitude <= east
+
+
+def test_sauna_beyond_mercator_range_is_in_top_tile(db):
+    add_saunas(db, (89.9, 10.0))
+    assert [sauna[0] for sauna in build_tile(db, 3, *tile_for_point(3, 89.9, 10.0))["saunas"]] == ["s0"]
+
+
+def test_sauna_on_tile_boundary_is_in_one_tile(db):
+    # 緯度0・経度0はズーム1の4つのタイルすべての境界上にある
+    add_saunas(db, (0.0, 0.0))
+    found = [(x, y) for x in range(2) for y in range(2) if build_tile(db, 1, x, y)["saunas"]]
+    assert found == [tile_for_point(1, 0.0, 0.0)]
+
+
+def test_clusters_up_to_cluster_max_zoom(db):
+    # クラスタのグリッドの1マスはズームを3つ上げたタイルと同じ大きさなので、その中心付近に2件置く
+    south, west, north, east = tile_bounds(TILE_CLUSTER_MAX_ZOOM + 3, 7270, 3225)
+    center = ((south + north) / 2, (west + east) / 2)
+    add_saunas(db, center, (center[0] + 1e-5, center[1] + 1e-5))
+    x, y = tile_for_point(TILE_CLUSTER_MAX_ZOOM, *center)
+
+    tile = build_tile(db, TILE_CLUSTER_MAX_ZOOM, x, y)
+    assert tile["saunas"] == []
+    assert [cluster[2] for cluster in tile["clusters"]] == [2]
+    assert tile["clusters"][0][:2] == pytest.approx([center[0] + 5e-6, center[1] + 5e-6], abs=1e-6)
+
+    x, y = tile_for_point(TILE_CLUSTER_MAX_ZOOM + 1, *center)
+    tile = build_tile(db, TILE_CLUSTER_MAX_ZOOM + 1, x, y)
+    assert tile["clusters"] == []
+    assert sorted(sauna[0] for sauna in tile["saunas"]) == ["s0", "s1"]
+
+
+def test_single_sauna_is_not_clustered(db):
+    add_saunas(db, (35.6812, 139.7671))
+    tile = build_tile(db, 5, *tile_for_point(5, 35.6812, 139.7671))
+    assert tile == {"clusters": [], "saunas": [["s0", "s0", 35.6812, 139.7671]]}
+
+
+def test_tile_is_invalidated_after_sauna_insert(db, client):
+    z = 15
+    x, y = tile_for_point(z, 35.68, 139.76)
+    first = client.get(f"/saunas/tiles/{z}/{x}/{y}")
+    assert first.json() == {"clusters": [], "saunas": []}
+    assert client.get(f"/saunas/tiles/{z}/{x}/{y}", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+    # 未登録のサウナへの投稿でサウナが登録され、そのタイルのキャッシュが消える
+    client.post("/users", json={"id": "u1", "email": "e", "name": "n"})
+    assert client.post("/posts", json={"user_id": "u1", "sauna_id": "new", "content": "a"}).status_code == 200
+    second = client.get(f"/saunas/tiles/{z}/{x}/{y}")
+    assert [sauna[0] for sauna in second.json()["saunas"]] == ["new"]
+    assert second.headers["etag"] != first.headers["etag"]
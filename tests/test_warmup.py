@@ -0,0 +1,154 @@
+import threading
+
+import pytest
+
+import database
+import google_places
+import tiles
+import warmup
+from cache import MISSING, get_cache
+from models import Sauna
+
+
+@pytest.fixture
+def calls(engine, monkeypatch):
+    # Google API の代わりに都道府県ごとに1件のサウナを返す
+    calls = []
+
+    def collect_place_ids(prefecture):
+        calls.append(prefecture)
+        return [prefecture]
+
+    def fetch_details(place_ids):
+        return [
+            {"id": place_id, "name": place_id, "address": "", "prefecture": place_id, "latitude": 35.0, "longitude": 139.0}
+            for place_id in place_ids
+        ]
+
+    monkeypatch.setattr(warmup, "collect_place_ids", collect_place_ids)
+    monkeypatch.setattr(warmup, "fetch_details", fetch_details)
+    return calls
+
+
+def test_resumes_from_progress_in_database(calls, monkeypatch):
+    fetch_details = warmup.fetch_details
+
+    def fail_tokyo(place_ids):
+        if place_ids == ["東京都"]:
+            raise RuntimeError("Google API error")
+        return fetch_details(place_ids)
+
+    monkeypatch.setattr(warmup, "fetch_details", fail_tokyo)
+    status = warmup.run_warmup()
+    assert status["completed_prefectures"] == len(warmup.PREFECTURES) - 1
+    assert [error["prefecture"] for error in status["errors"]] == ["東京都"]
+
+    # 失敗した都道府県だけを再実行する
+    monkeypatch.setattr(warmup, "fetch_details", fetch_details)
+    calls.clear()
+    status = warmup.run_warmup()
+    assert calls == ["東京都"]
+    assert status["completed_prefectures"] == len(warmup.PREFECTURES)
+    db = database.SessionLocal()
+    try:
+        assert db.query(Sauna).count() == len(warmup.PREFECTURES)
+    finally:
+        db.close()
+
+
+def test_start_while_running_is_rejected(calls, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    collect_place_ids = warmup.collect_place_ids
+
+    def blocking_collect(prefecture):
+        started.set()
+        release.wait(5)
+        return collect_place_ids(prefecture)
+
+    monkeypatch.setattr(warmup, "collect_place_ids", blocking_collect)
+    assert warmup.start_warmup(restart=True)
+    assert not warmup.start_warmup()
+    with pytest.raises(RuntimeError):
+        warmup.run_warmup()
+
+    assert started.wait(5)
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == "warmup":
+            thread.join(5)
+    status = warmup.get_status()
+    assert not status["running"]
+    assert status["completed_prefectures"] == len(warmup.PREFECTURES)
+
+
+class FakeResponse:
+    status_code = 200
+    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    """
+    テキスト検索に順番に responses を返す
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.params = []
+
+    def get(self, url, params=None):
+        self.params.append(params)
+        return FakeResponse(self.responses.pop(0))
+
+
+@pytest.fixture
+def places(engine, monkeypatch):
+    monkeypatch.setattr(warmup, "PREFECTURES", ["東京都"])
+    monkeypatch.setattr(warmup, "NEXT_PAGE_TOKEN_DELAY", 0)
+    monkeypatch.setattr(warmup, "fetch_details", lambda place_ids: [])
+
+    def use(*responses):
+        session = FakeSession(responses)
+        monkeypatch.setattr(google_places, "get_http_session", lambda: session)
+        return session
+
+    return use
+
+
+@pytest.mark.parametrize("status", ["OVER_QUERY_LIMIT", "REQUEST_DENIED", "INVALID_REQUEST"])
+def test_places_error_leaves_prefecture_incomplete(places, status):
+    # HTTP 200 でも status がエラーなら完了扱いにしない
+    places({"status": status, "results": []})
+    result = warmup.run_warmup()
+    assert result["completed_prefectures"] == 0
+    assert status in result["errors"][0]["error"]
+
+
+def test_next_page_token_is_retried(places):
+    session = places(
+        {"status": "OK", "results": [{"place_id": "p1"}], "next_page_token": "t1"},
+        {"status": "INVALID_REQUEST", "results": []},
+        {"status": "OK", "results": [{"place_id": "p2"}]},
+    )
+    assert warmup.collect_place_ids("東京都") == ["p1", "p2"]
+    assert [params.get("pagetoken") for params in session.params] == [None, "t1", "t1"]
+
+
+def test_moved_sauna_invalidates_old_tiles(calls):
+    row = {"id": "s1", "name": "s1", "address": "", "prefecture": "東京都", "latitude": 35.0, "longitude": 139.0}
+    warmup.upsert_saunas([row])
+    z = 15
+    x, y = tiles.tile_for_point(z, 35.0, 139.0)
+    db = database.SessionLocal()
+    try:
+        assert "s1" in tiles.get_tile(db, z, x, y)[0]
+    finally:
+        db.close()
+
+    warmup.upsert_saunas([{**row, "latitude": 36.0}])
+    assert get_cache().namespace("sauna_tiles").get(f"{z}/{x}/{y}") is MISSING
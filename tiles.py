@@ -0,0 +1,138 @@
+import hashlib
+import json
+import math
+import os
+from typing import Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import get_cache
+from models import Sauna
+
+# このズームレベル以下ではサウナをまとめて (件数と重心) 返す
+TILE_CLUSTER_MAX_ZOOM = int(os.getenv("TILE_CLUSTER_MAX_ZOOM", "13"))
+# クラスタリングの際にタイルを何分割するか (1辺あたり)
+TILE_CLUSTER_GRID = int(os.getenv("TILE_CLUSTER_GRID", "8"))
+TILE_CACHE_TTL = int(os.getenv("TILE_CACHE_TTL", str(24 * 60 * 60)))
+# 共有キャッシュ (CACHE_URL) が無い場合のキャッシュ時間 (秒)
+# 無効化は自分のプロセスにしか届かないため、他のインスタンスが古いタイルを返すのはこの時間までにする
+TILE_LOCAL_CACHE_TTL = int(os.getenv("TILE_LOCAL_CACHE_TTL", "60"))
+TILE_MAX_ZOOM = 22
+
+# Web メルカトルで表示できる緯度の範囲
+MAX_LATITUDE = 85.05112878
+
+
+def _tile_fraction(z: int, latitude: float, longitude: float) -> Tuple[float, float]:
+    # 緯度経度をズーム z のタイル座標 (小数) に変換する
+    n = 2**z
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    x = (longitude + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n
+    return min(max(x, 0.0), n - 1e-9), min(max(y, 0.0), n - 1e-9)
+
+
+def tile_for_point(z: int, latitude: float, longitude: float) -> Tuple[int, int]:
+    x, y = _tile_fraction(z, latitude, longitude)
+    return int(x), int(y)
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """
+    タイルの範囲を (南端, 西端, 北端, 東端) で返す
+    """
+    n = 2**z
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0
+
+
+def build_tile(db: Session, z: int, x: int, y: int) -> dict:
+    """
+    タイル内のサウナを返す。低ズームではグリッドごとにまとめる
+        clusters: [[緯度, 経度, 件数], ...]
+        saunas:   [[id, 名前, 緯度, 経度], ...]
+    """
+    south, west, north, east = tile_bounds(z, x, y)
+    # 表示範囲外の高緯度のサウナは tile_for_point と同じく上端・下端のタイルに含める
+    if y == 0:
+        north = 90.0
+    if y == 2**z - 1:
+        south = -90.0
+    rows = (
+        db.query(Sauna.id, Sauna.name, Sauna.latitude, Sauna.longitude)
+        .filter(
+            Sauna.latitude >= south,
+            Sauna.latitude <= north,
+            Sauna.longitude >= west,
+            Sauna.longitude <= east,
+        )
+        .all()
+    )
+    # 境界上のサウナが隣のタイルと重複しないように絞り込む
+    rows = [row for row in rows if tile_for_point(z, row[2], row[3]) == (x, y)]
+
+    if z > TILE_CLUSTER_MAX_ZOOM:
+        return {"clusters": [], "saunas": [list(row) for row in rows]}
+
+    cells = {}
+    for row in rows:
+        fx, fy = _tile_fraction(z, row[2], row[3])
+        cell = (int((fx - x) * TILE_CLUSTER_GRID), int((fy - y) * TILE_CLUSTER_GRID))
+        cells.setdefault(cell, []).append(row)
+
+    clusters, saunas = [], []
+    for members in cells.values():
+        if len(members) == 1:
+            saunas.append(list(members[0]))
+        else:
+            latitude = sum(row[2] for row in members) / len(members)
+            longitude = sum(row[3] for row in members) / len(members)
+            clusters.append([round(latitude, 6), round(longitude, 6), len(members)])
+    return {"clusters": clusters, "saunas": saunas}
+
+
+def get_tile(db: Session, z: int, x: int, y: int) -> Tuple[str, str]:
+    """
+    タイルを JSON 文字列とその ETag で返す (キャッシュ済みならDBを読まない)
+
+    db はプライマリのセッションを渡す (遅延のあるレプリカから作ると、無効化した直後に
+    新しいサウナを含まないタイルが TILE_CACHE_TTL の間キャッシュされてしまうため)
+    """
+    cache = get_cache()
+    tile_cache = cache.namespace("sauna_tiles")
+    ttl = TILE_CACHE_TTL if cache.shared is not None else TILE_LOCAL_CACHE_TTL
+
+    def load():
+        body = json.dumps(build_tile(db, z, x, y), ensure_ascii=False, separators=(",", ":"))
+        return [body, hashlib.sha1(body.encode()).hexdigest()]
+
+    body, etag = tile_cache.get_or_set(f"{z}/{x}/{y}", load, ttl)
+    return body, etag
+
+
+def invalidate_tiles_for_point(latitude, longitude):
+    """
+    指定した地点を含むタイルのキャッシュを全ズームレベルで削除する
+    """
+    if latitude is None or longitude is None:
+        return
+    tile_cache = get_cache().namespace("sauna_tiles")
+    for z in range(TILE_MAX_ZOOM + 1):
+        x, y = tile_for_point(z, float(latitude), float(longitude))
+        tile_cache.delete(f"{z}/{x}/{y}")
+
+
+def invalidate_tiles_after_commit(db: Session, points: list):
+    """
+    セッションがコミットされた後に、各地点 [(緯度, 経度), ...] を含むタイルのキャッシュを削除する
+    """
+
+    def invalidate(session):
+        for latitude, longitude in points:
+            invalidate_tiles_for_point(latitude, longitude)
+
+    event.listen(db, "after_commit", invalidate, once=True)
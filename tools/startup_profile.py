@@ -0,0 +1,105 @@
+"""
+コールドスタートの計測ツール
+
+    python tools/startup_profile.py importtime [--top 25]
+        main を import したときのモジュールごとの import 時間を表示する
+    python tools/startup_profile.py bench [--runs 10] [--path /]
+        新しいプロセスで「main の import」と「最初のリクエスト」にかかる時間を計測する
+
+DATABASE_URL / GOOGLE_PLACES_API_KEY が未設定の場合はダミー値で計測する。
+LAZY_INIT=false を付けて実行すると遅延初期化なしの場合と比較できる
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_SCRIPT = """
+import time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(main.app, raise_server_exceptions=False)
+t2 = time.perf_counter()
+response = client.get({path!r})
+t3 = time.perf_counter()
+print(t1 - t0, t3 - t2, response.status_code)
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite://")
+    env.setdefault("GOOGLE_PLACES_API_KEY", "dummy")
+    env.setdefault("SQL_ECHO", "false")
+    return env
+
+
+def importtime(top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        env=_env(),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+
+    # 形式: "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+
+    total = sum(self_us for _, self_us, _ in rows)
+    print(f"total import time: {total / 1000:.1f} ms ({len(rows)} modules)\n")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>9.1f} ms {self_us / 1000:>7.1f} ms  {name}")
+
+
+def bench(runs: int, path: str):
+    import_times, request_times = [], []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", BENCH_SCRIPT.format(path=path)],
+            cwd=ROOT,
+            env=_env(),
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            sys.exit(result.stderr)
+        import_time, request_time, status_code = result.stdout.split()[-3:]
+        import_times.append(float(import_time) * 1000)
+        request_times.append(float(request_time) * 1000)
+
+    print(f"runs: {runs}, path: {path} (status {status_code})")
+    for label, values in (("import main", import_times), ("first request", request_times)):
+        print(
+            f"{label:>14}: median {statistics.median(values):.1f} ms, "
+            f"min {min(values):.1f} ms, max {max(values):.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    importtime_parser = subparsers.add_parser("importtime")
+    importtime_parser.add_argument("--top", type=int, default=25)
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--runs", type=int, default=10)
+    bench_parser.add_argument("--path", default="/")
+    args = parser.parse_args()
+
+    if args.command == "importtime":
+        importtime(args.top)
+    else:
+        bench(args.runs, args.path)
@@ -0,0 +1,170 @@
+"""
+投稿ストリームの負荷計測ツール
+
+    python tools/stream_bench.py broker [--subscribers 5000] [--channels 50] [--events 200]
+        プロセス内の PostBroker に多数の購読者をつなぎ、publish から全購読者に届くまでの時間を計測する
+    python tools/stream_bench.py sse [--subscribers 2000] [--posts 5] [--port 8799]
+        uvicorn を別プロセスで起動し、多数の SSE 接続を張った状態で POST /posts し、
+        全接続にイベントが届くまでの時間を計測する (ulimit -n を接続数より大きくしておく)
+
+DATABASE_URL が未設定の場合は一時的な SQLite ファイルを使う
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/stream_bench.db")
+    env.setdefault("GOOGLE_PLACES_API_KEY", "dummy")
+    env.setdefault("SQL_ECHO", "false")
+    env.setdefault("RATE_LIMIT_ENABLED", "false")
+    return env
+
+
+def _print_latencies(label: str, latencies: list):
+    latencies = sorted(latencies)
+    print(
+        f"{label}: {len(latencies)} deliveries, "
+        f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms, "
+        f"max {latencies[-1] * 1000:.1f} ms"
+    )
+
+
+async def _bench_broker(subscribers: int, channels: int, events: int):
+    os.environ.update(_env())
+    from pubsub import PostBroker
+
+    broker = PostBroker(queue_size=events + 1)
+    subscriptions = [broker.subscribe(f"sauna-{i % channels}") for i in range(subscribers)]
+    latencies = []
+
+    async def consume(subscriber, expected):
+        for _ in range(expected):
+            sent_at = float(await subscriber.get())
+            latencies.append(time.perf_counter() - sent_at)
+
+    per_channel = {}
+    for subscriber in subscriptions:
+        per_channel[subscriber.channel] = per_channel.get(subscriber.channel, 0) + 1
+    consumers = [asyncio.create_task(consume(s, events // channels)) for s in subscriptions]
+
+    started = time.perf_counter()
+    for i in range(events // channels * channels):
+        broker.publish(f"sauna-{i % channels}", repr(time.perf_counter()))
+        if i % channels == channels - 1:
+            await asyncio.sleep(0)
+    await asyncio.gather(*consumers)
+    elapsed = time.perf_counter() - started
+
+    print(f"subscribers: {subscribers}, channels: {channels}, events: {events // channels * channels}")
+    _print_latencies("publish -> deliver", latencies)
+    print(f"total: {elapsed:.2f} s ({len(latencies) / elapsed:,.0f} deliveries/s)")
+
+
+def _prepare_database(env: dict):
+    # 投稿に必要なユーザーとサウナを先に登録しておく (Google API を呼ばないため)
+    code = (
+        "import models, database\n"
+        "from sqlalchemy import text\n"
+        "engine = database.get_engine()\n"
+        "models.Base.metadata.create_all(engine)\n"
+        "with engine.begin() as c:\n"
+        "    c.execute(text(\"DELETE FROM users WHERE id = 'bench'\"))\n"
+        "    c.execute(text(\"INSERT INTO users (id, email, name) VALUES ('bench', 'bench@example.com', 'bench')\"))\n"
+        "    c.execute(text(\"DELETE FROM saunas WHERE id = 'bench'\"))\n"
+        "    c.execute(text(\"INSERT INTO saunas (id, name, address, prefecture, latitude, longitude) "
+        "VALUES ('bench', 'bench', '-', '-', 35.0, 139.0)\"))\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+
+
+async def _bench_sse(subscribers: int, posts: int, port: int):
+    import httpx
+
+    env = _env()
+    _prepare_database(env)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(
+            base_url=base_url, timeout=60, limits=httpx.Limits(max_connections=subscribers + 10)
+        ) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+            connected = 0
+            all_connected = asyncio.Event()
+            received = []
+
+            async def subscribe():
+                nonlocal connected
+                async with client.stream("GET", "/saunas/bench/posts/stream") as response:
+                    count = 0
+                    async for line in response.aiter_lines():
+                        if line == ": connected":
+                            connected += 1
+                            if connected == subscribers:
+                                all_connected.set()
+                        elif line.startswith("data:"):
+                            received.append(time.perf_counter())
+                            count += 1
+                            if count == posts:
+                                return
+
+            started = time.perf_counter()
+            tasks = [asyncio.create_task(subscribe()) for _ in range(subscribers)]
+            await asyncio.wait_for(all_connected.wait(), 120)
+            print(f"connected {subscribers} SSE subscribers in {time.perf_counter() - started:.2f} s")
+
+            latencies = []
+            for i in range(posts):
+                before = len(received)
+                posted_at = time.perf_counter()
+                response = await client.post("/posts", json={"user_id": "bench", "sauna_id": "bench", "content": str(i)})
+                response.raise_for_status()
+                while len(received) - before < subscribers:
+                    await asyncio.sleep(0.005)
+                latencies.extend(at - posted_at for at in received[before:])
+            await asyncio.gather(*tasks)
+            _print_latencies("POST /posts -> all subscribers", latencies)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    broker_parser = subparsers.add_parser("broker")
+    broker_parser.add_argument("--subscribers", type=int, default=5000)
+    broker_parser.add_argument("--channels", type=int, default=50)
+    broker_parser.add_argument("--events", type=int, default=200)
+    sse_parser = subparsers.add_parser("sse")
+    sse_parser.add_argument("--subscribers", type=int, default=2000)
+    sse_parser.add_argument("--posts", type=int, default=5)
+    sse_parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+
+    if args.command == "broker":
+        asyncio.run(_bench_broker(args.subscribers, args.channels, args.events))
+    else:
+        asyncio.run(_bench_sse(args.subscribers, args.posts, args.port))
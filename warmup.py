@@ -0,0 +1,287 @@
+"""
+都道府県ごとのサウナ情報の事前取得 (ウォームアップ)
+
+    python warmup.py [--restart]
+
+Places のテキスト検索を都道府県ごとにページングし、詳細情報を並列に取得して
+saunas テーブルへまとめて upsert する。取得した結果はキャッシュにも保存する。
+完了した都道府県は warmup_progress テーブルに記録し、中断しても続きから再開できる
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+
+from database import SessionLocal, get_engine, upsert_statement
+from feed import refresh_sauna_names_in_feed
+from google_places import (
+    PlacesAPIError,
+    cache_search_results,
+    fetch_sauna_details_from_google,
+    format_search_results,
+    sauna_search_keyword,
+    text_search_places,
+)
+from models import Sauna, WarmupProgress, get_jst_now
+from ratelimit import InMemoryTokenBucket
+from tiles import invalidate_tiles_after_commit
+
+# Google Places API を呼ぶ並列数と、1秒あたりの最大リクエスト数
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+WARMUP_QPS = float(os.getenv("WARMUP_QPS", "5"))
+# テキスト検索で取得する最大ページ数 (Google の上限は3ページ)
+WARMUP_MAX_PAGES = int(os.getenv("WARMUP_MAX_PAGES", "3"))
+# next_page_token が使えるようになるまでの待ち時間 (秒) と試行回数
+# (早すぎると INVALID_REQUEST が返るので、待ち時間を倍にしながら再試行する)
+NEXT_PAGE_TOKEN_DELAY = 2
+NEXT_PAGE_TOKEN_ATTEMPTS = 4
+
+PREFECTURES = [
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
+    "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県",
+    "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県",
+    "静岡県", "愛知県", "三重県", "滋賀県", "京都府", "大阪府", "兵庫県",
+    "奈良県", "和歌山県", "鳥取県", "島根県", "岡山県", "広島県", "山口県",
+    "徳島県", "香川県", "愛媛県", "高知県", "福岡県", "佐賀県", "長崎県",
+    "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県",
+]
+
+_quota = InMemoryTokenBucket()
+_status = {"running": False}
+_status_lock = threading.Lock()
+
+
+def load_completed() -> set:
+    """
+    ウォームアップを完了した都道府県を返す
+    """
+    get_engine()
+    db = SessionLocal()
+    try:
+        return {prefecture for (prefecture,) in db.query(WarmupProgress.prefecture)}
+    finally:
+        db.close()
+
+
+def mark_completed(prefecture: str, upserted: int):
+    get_engine()
+    db = SessionLocal()
+    try:
+        statement = upsert_statement(db, WarmupProgress).values(
+            prefecture=prefecture, upserted=upserted, completed_at=get_jst_now()
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["prefecture"],
+            set_={"upserted": statement.excluded.upserted, "completed_at": statement.excluded.completed_at},
+        )
+        db.execute(statement)
+        db.commit()
+    finally:
+        db.close()
+
+
+def reset_progress():
+    """
+    完了した都道府県の記録を消して、最初からやり直せるようにする
+    """
+    get_engine()
+    db = SessionLocal()
+    try:
+        db.query(WarmupProgress).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def get_status() -> dict:
+    """
+    ウォームアップの進捗を返す
+    """
+    with _status_lock:
+        status = dict(_status)
+    status["completed_prefectures"] = len(load_completed())
+    status["total_prefectures"] = len(PREFECTURES)
+    return status
+
+
+def _update_status(**values):
+    with _status_lock:
+        _status.update(values)
+
+
+def _wait_for_quota():
+    # Google API の呼び出しを WARMUP_QPS 以下に抑える
+    while True:
+        allowed, retry_after = _quota.acquire("google", WARMUP_QPS, WARMUP_QPS)
+        if allowed:
+            return
+        time.sleep(retry_after)
+
+
+def _search_page(search_keyword: str, page_token: Optional[str]):
+    for attempt in range(1, NEXT_PAGE_TOKEN_ATTEMPTS + 1):
+        if page_token:
+            time.sleep(NEXT_PAGE_TOKEN_DELAY * 2 ** (attempt - 1))
+        _wait_for_quota()
+        try:
+            return text_search_places(search_keyword, page_token=page_token)
+        except PlacesAPIError as e:
+            if not page_token or e.status != "INVALID_REQUEST" or attempt == NEXT_PAGE_TOKEN_ATTEMPTS:
+                raise
+            print(f"next_page_token がまだ使えません。再試行します ({attempt}/{NEXT_PAGE_TOKEN_ATTEMPTS})")
+
+
+def collect_place_ids(prefecture: str) -> list:
+    """
+    都道府県のサウナをテキスト検索し、place_id の一覧を返す。1ページ目は検索結果のキャッシュにも保存する
+    """
+    search_keyword = sauna_search_keyword(prefecture, None)
+    place_ids = []
+    page_token = None
+    for page in range(WARMUP_MAX_PAGES):
+        google_results, page_token = _search_page(search_keyword, page_token)
+        if page == 0:
+            cache_search_results(search_keyword, format_search_results(google_results))
+        place_ids.extend(result["place_id"] for result in google_results if result.get("place_id"))
+        if not page_token:
+            break
+    return list(dict.fromkeys(place_ids))
+
+
+def fetch_details(place_ids: list) -> list:
+    """
+    詳細情報を並列に取得する (詳細情報のキャッシュにも保存される)。
+    見つからないサウナは飛ばし、API のエラー (OVER_QUERY_LIMIT など) は PlacesAPIError を送出する
+    """
+
+    def fetch(place_id):
+        _wait_for_quota()
+        try:
+            return fetch_sauna_details_from_google(place_id)
+        except PlacesAPIError:
+            raise
+        except HTTPException as e:
+            print(f"{place_id} の詳細情報を取得できませんでした: {e.detail}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=WARMUP_CONCURRENCY) as executor:
+        return [row for row in executor.map(fetch, place_ids) if row and row["latitude"] is not None]
+
+
+def upsert_saunas(rows: list) -> int:
+    """
+    サウナ情報をまとめて登録・更新する
+    """
+    if not rows:
+        return 0
+    get_engine()
+    db = SessionLocal()
+    try:
+        statement = upsert_statement(db, Sauna)
+        statement = statement.on_conflict_do_update(
+            index_elements=["id"],
+            set_={
+                "name": statement.excluded.name,
+                "address": statement.excluded.address,
+                "prefecture": statement.excluded.prefecture,
+                "latitude": statement.excluded.latitude,
+                "longitude": statement.excluded.longitude,
+            },
+        )
+        # 位置が変わるサウナは、移動前の地点のタイルも無効化する
+        old_points = {
+            sauna_id: (latitude, longitude)
+            for sauna_id, latitude, longitude in db.query(Sauna.id, Sauna.latitude, Sauna.longitude).filter(
+                Sauna.id.in_([row["id"] for row in rows])
+            )
+        }
+        points = [(row["latitude"], row["longitude"]) for row in rows]
+        points += [
+            old_points[row["id"]]
+            for row in rows
+            if row["id"] in old_points and old_points[row["id"]] != (row["latitude"], row["longitude"])
+        ]
+        db.execute(statement, rows)
+        # サウナ名が変わっていれば投稿一覧にも反映する
+        refresh_sauna_names_in_feed(db, [row["id"] for row in rows])
+        invalidate_tiles_after_commit(db, points)
+        db.commit()
+    finally:
+        db.close()
+    return len(rows)
+
+
+def _begin():
+    # 実行中でなければ実行中にする (確認と更新をまとめてロックの中で行う)
+    with _status_lock:
+        if _status["running"]:
+            return False
+        _status.clear()
+        _status.update(running=True, started_at=datetime.now().isoformat(), upserted=0, errors=[])
+        return True
+
+
+def _run(restart: bool, time_budget: Optional[float]) -> dict:
+    deadline = time.monotonic() + time_budget if time_budget else None
+    try:
+        completed = load_completed()
+        if restart or len(completed) >= len(PREFECTURES):
+            reset_progress()
+            completed = set()
+
+        for prefecture in PREFECTURES:
+            if prefecture in completed:
+                continue
+            if deadline and time.monotonic() > deadline:
+                break
+            _update_status(current=prefecture)
+            try:
+                rows = fetch_details(collect_place_ids(prefecture))
+                upserted = upsert_saunas(rows)
+                mark_completed(prefecture, upserted)
+            except Exception as e:
+                # 失敗した都道府県は完了扱いにせず、次回の実行で再試行する
+                print(f"{prefecture} のウォームアップに失敗しました: {e}")
+                with _status_lock:
+                    _status["errors"].append({"prefecture": prefecture, "error": str(e)})
+                continue
+
+            completed.add(prefecture)
+            with _status_lock:
+                _status["upserted"] += upserted
+            print(f"{prefecture}: {upserted}件 ({len(completed)}/{len(PREFECTURES)})")
+    finally:
+        _update_status(running=False, current=None, finished_at=datetime.now().isoformat())
+    return get_status()
+
+
+def run_warmup(restart: bool = False, time_budget: Optional[float] = None) -> dict:
+    """
+    未完了の都道府県を順番にウォームアップする。
+    time_budget (秒) を超えたら次の都道府県に進まずに終了する (続きは次回の実行で再開する)
+    """
+    if not _begin():
+        raise RuntimeError("ウォームアップは既に実行中です")
+    return _run(restart, time_budget)
+
+
+def start_warmup(restart: bool = False) -> bool:
+    """
+    バックグラウンドのスレッドでウォームアップを開始する。既に実行中なら False
+
+    レスポンスを返した後もプロセスが動き続けるサーバー向け。
+    Vercel などのサーバーレス環境ではレスポンス後にスレッドが止まるため、run_warmup に time_budget を指定して使う
+    """
+    if not _begin():
+        return False
+    threading.Thread(target=_run, args=(restart, None), name="warmup", daemon=True).start()
+    return True
+
+
+if __name__ == "__main__":
+    print(run_warmup(restart="--restart" in sys.argv))